@@ -45,8 +45,11 @@ async def main():
     start_time = datetime.datetime.now()
     logger.info(f"Script started at {start_time}")
     
-    # Use current directory for session file
-    session_file = os.path.join(os.getcwd(), "telegram_session")
+    # Use current directory for session file, unless another one is given
+    # (e.g. `python auth.py sessions/account2` to add an account to the pool)
+    session_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), "telegram_session")
+    if os.path.dirname(session_file):
+        os.makedirs(os.path.dirname(session_file), exist_ok=True)
     logger.info(f"Using session file: {session_file}")
     
     # Debug info
@@ -0,0 +1,80 @@
+"""Parse a list of chats in one batch on a running Parser Pro Web server.
+
+Targets are read from a file, one chat ID, username or link per line, or
+from stdin. Waits for the batch to finish and optionally downloads the
+merged, deduplicated users:
+
+    python batch.py chats.txt --output users.csv
+    cat chats.txt | python batch.py - --server http://localhost:8000 --output users.ndjson
+"""
+from urllib.parse import urlencode
+from urllib.request import urlopen
+import argparse
+import json
+import shutil
+import sys
+import time
+
+
+def submit(server, targets, args):
+    form = {"targets": "\n".join(targets)}
+    if args.exhaustive:
+        form["exhaustive"] = "true"
+    if args.concurrency:
+        form["concurrency"] = args.concurrency
+    if args.max_users:
+        form["max_users"] = args.max_users
+    # The server redirects to the results page of the new batch
+    with urlopen(f"{server}/batch", data=urlencode(form).encode()) as response:
+        url = response.geturl()
+    if "/results/" not in url:
+        raise SystemExit("The server did not accept the batch; check the target list")
+    return url.split("/results/")[1].split("?")[0]
+
+
+def wait(server, batch_id, interval):
+    while True:
+        with urlopen(f"{server}/jobs/{batch_id}") as response:
+            job = json.load(response)
+        stats = job.get("stats") or {}
+        print(
+            f"\r{job['status']}: {stats.get('done', 0)} chats done, {stats.get('failed', 0)} failed, "
+            f"{job.get('users_kept', 0)} users", end="", file=sys.stderr
+        )
+        if job["status"] in ("done", "failed"):
+            print(file=sys.stderr)
+            return job
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", help="file with one chat per line, or - for stdin")
+    parser.add_argument("--server", default="http://localhost:8000")
+    parser.add_argument("--exhaustive", action="store_true", help="also search members by name in large chats")
+    parser.add_argument("--concurrency", type=int, help="chats parsed at a time")
+    parser.add_argument("--max-users", type=int, help="users kept per chat")
+    parser.add_argument("--output", help="download the users to this .csv or .ndjson file")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between status checks")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.targets == "-" else open(args.targets, encoding="utf-8")
+    with source:
+        targets = [line.strip() for line in source if line.strip() and not line.startswith("#")]
+    server = args.server.rstrip("/")
+
+    batch_id = submit(server, targets, args)
+    print(f"Batch {batch_id}: {server}/results/{batch_id}", file=sys.stderr)
+    job = wait(server, batch_id, args.interval)
+    if job["status"] == "failed":
+        raise SystemExit(f"Batch failed: {job.get('error')}")
+
+    if args.output:
+        fmt = "ndjson" if args.output.endswith(".ndjson") else "csv"
+        with urlopen(f"{server}/results/{batch_id}/export.{fmt}") as response, open(args.output, "wb") as output:
+            shutil.copyfileobj(response, output)
+        print(f"Saved users to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Crawl and render benchmarks against `fake_telegram.FakeTelegramClient`.
+
+For each dataset size, runs an exhaustive /parse and a /comments crawl
+(keeping every comment) through the app's job engine, then times rendering
+of result pages, comment searches and a CSV export. Then crawls the chat
+again after some churn and times the diff between the two crawls. Reports
+users/s, comments/s, RPCs per method, FloodWaits, peak RSS and median page
+render latency. No Telegram account is needed.
+
+Run from the project root:
+
+    python benchmarks/crawl_suite.py --sizes 1000,10000,100000,1000000
+    python benchmarks/crawl_suite.py --latency 0.05 --flood-rate 0.01 --rate 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def wait_for_job(client, job_id, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f"Job {job_id} did not finish in {timeout}s")
+
+
+def time_get(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        response.read()
+        timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return statistics.median(timings) * 1000
+
+
+def run(size, args):
+    import main
+    from fake_telegram import FIRST_USER_ID, FakeTelegramClient
+    from fastapi.testclient import TestClient
+
+    fake = FakeTelegramClient(
+        users=size, posts=args.posts, replies_per_post=args.replies, latency=args.latency,
+        flood_rate=args.flood_rate, flood_seconds=args.flood_seconds
+    )
+
+    async def start_fake(*_):
+        return fake
+
+    main.BOT_TOKENS = ["benchmark"]
+    main.start_bot_client = start_fake
+    main.start_user_client = start_fake
+    main.user_session_files = lambda: ["benchmark"]
+
+    print(f"\n{size:,} users (RSS after building the dataset: {peak_rss_mb() or 0:.0f} MiB)")
+    with TestClient(main.app) as client:
+        fake.calls.clear()
+        start = time.perf_counter()
+        response = client.post("/parse", data={"chat_id": "benchmark", "exhaustive": "true"}, follow_redirects=False)
+        parse_id = response.headers["location"].split("/")[2].split("?")[0]
+        job = wait_for_job(client, parse_id, args.timeout)
+        elapsed = time.perf_counter() - start
+        print(f"  parse:     {job['status']}, {job['users_kept']:,} users in {elapsed:.2f}s "
+              f"({job['users_kept'] / elapsed:,.0f} users/s), {job['pages_fetched']:,} pages")
+        print(f"             RPCs {dict(fake.calls)}, FloodWaits {fake.flood_waits}")
+
+        fake.calls.clear()
+        fake.replies_served = 0
+        start = time.perf_counter()
+        response = client.post("/comments", data={"channel_id": "benchmark", "limit": str(args.posts), "all_comments": "true"}, follow_redirects=False)
+        comments_id = response.headers["location"].split("/")[2].split("?")[0]
+        job = wait_for_job(client, comments_id, args.timeout)
+        elapsed = time.perf_counter() - start
+        print(f"  comments:  {job['status']}, {fake.replies_served:,} comments in {elapsed:.2f}s "
+              f"({fake.replies_served / elapsed:,.0f} comments/s), {job['users_kept']:,} commenters")
+        print(f"             RPCs {dict(fake.calls)}, FloodWaits {fake.flood_waits}")
+
+        last_page = max(1, size // 100)
+        renders = {
+            "first page": f"/results/{parse_id}?page=1",
+            "last page": f"/results/{parse_id}?page={last_page}",
+            "filtered": f"/results/{parse_id}?premium_only=true&sort=username&page=1",
+            "rows json": f"/results/{parse_id}/rows?after={size // 2}&limit=100",
+            "comments": f"/comments_results/{comments_id}?page=1",
+            "search": f"/comments_results/{comments_id}/search?q=reply+7*",
+            "by author": f"/comments_results/{comments_id}/search?user={FIRST_USER_ID}",
+        }
+        for name, url in renders.items():
+            print(f"  render:    {name:<11} {time_get(client, url, args.repeat):8.1f} ms")
+        start = time.perf_counter()
+        client.get(f"/results/{parse_id}/export.csv").read()
+        print(f"  export:    csv {time.perf_counter() - start:.2f}s")
+
+        fake.churn()
+        response = client.post("/parse", data={"chat_id": "benchmark", "exhaustive": "true"}, follow_redirects=False)
+        recrawl_id = response.headers["location"].split("/")[2].split("?")[0]
+        wait_for_job(client, recrawl_id, args.timeout)
+        start = time.perf_counter()
+        counts = client.get(f"/results/{recrawl_id}/diff/rows?change=changed").json()["counts"]
+        print(f"  diff:      {counts} in {(time.perf_counter() - start) * 1000:.0f} ms "
+              f"(cached: {time_get(client, f'/results/{recrawl_id}/diff/rows?change=joined', args.repeat):.1f} ms)")
+        start = time.perf_counter()
+        client.get(f"/results/{recrawl_id}/diff.csv").read()
+        print(f"             csv {time.perf_counter() - start:.2f}s")
+    print(f"  peak RSS:  {peak_rss_mb() or 0:.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated member counts")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--replies", type=int, default=50, help="replies per post")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every RPC")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of RPCs failing with a FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=1e6, help="starting requests/s of the rate limiter")
+    parser.add_argument("--repeat", type=int, default=5, help="renders timed per page")
+    parser.add_argument("--timeout", type=float, default=3600)
+    args = parser.parse_args()
+
+    # The app reads its settings at import time
+    store_dir = tempfile.mkdtemp(prefix="tgscan-bench-")
+    os.environ["RESULT_STORE_PATH"] = os.path.join(store_dir, "results.db")
+    os.environ.setdefault("BOT_TOKEN", "benchmark")
+    os.environ["TELEGRAM_RATE"] = str(args.rate)
+    os.environ["TELEGRAM_MAX_RATE"] = str(max(args.rate, 30))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(ROOT)
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        run(size, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""A local stand-in for `TelegramClient`, serving a synthetic chat and channel.
+
+Covers the calls the crawlers make: participant searches, `users.GetUsers`,
+`get_entity`, `get_input_entity` and `get_messages` for posts and their
+replies. Every call can be slowed down by `latency` seconds and fail with a
+FloodWait `flood_rate` of the time. Users are kept as compact tuples and
+only turned into Telethon objects when served, so datasets of a million
+users fit in memory next to the app being measured.
+"""
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import asyncio
+import random
+import string
+import time
+
+from telethon import functions, types
+from telethon.errors import FloodWaitError
+
+FIRST_NAMES = ["Alex", "Maria", "Ivan", "Olga", "John", "Anna", "Dmytro", "Sofia", "Max", "Elena"]
+LAST_NAMES = ["Smith", "Ivanova", "Kovalenko", None, "Brown", "Petrov", None, "Garcia"]
+FIRST_USER_ID = 10_000_000
+
+
+class FakeTelegramClient:
+    def __init__(self, users=10_000, posts=100, replies_per_post=50, latency=0.0,
+                 flood_rate=0.0, flood_seconds=1, search_cap=10_000, seed=42):
+        rng = random.Random(seed)
+        now = time.time()
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.search_cap = search_cap
+        self.calls = Counter()
+        self.flood_waits = 0
+        self.replies_served = 0
+        self._rng = random.Random(seed + 1)
+        self.users = [
+            (
+                FIRST_USER_ID + i,
+                "".join(rng.choice(string.ascii_lowercase) for _ in range(8)),
+                FIRST_NAMES[rng.randrange(len(FIRST_NAMES))],
+                LAST_NAMES[rng.randrange(len(LAST_NAMES))],
+                rng.random() < 0.05,
+                int(now - rng.randint(0, 30 * 86400))
+            )
+            for i in range(users)
+        ]
+        self._index()
+        self.posts = posts
+        self.replies_per_post = replies_per_post
+        self.channel = types.Channel(
+            id=1_000_000_001, title="Benchmark chat", photo=types.ChatPhotoEmpty(),
+            date=datetime.now(), access_hash=1
+        )
+
+    def _index(self):
+        # Searches match username prefixes, like Telegram does for @names
+        self._by_username = sorted((user[1], i) for i, user in enumerate(self.users))
+        self._usernames = [name for name, _ in self._by_username]
+        self._searches = {}
+
+    def churn(self, share=0.01, seed=7):
+        """Change the chat as between two crawls: `share` of the members
+        leave and as many new ones join, as many change their username or
+        premium status, and the rest may have been online since."""
+        rng = random.Random(seed)
+        now = int(time.time())
+        next_id = max(user[0] for user in self.users) + 1
+        for i in range(len(self.users)):
+            user_id, username, first_name, last_name, premium, was_online = self.users[i]
+            roll = rng.random()
+            if roll < share:
+                user_id, username = next_id, "".join(rng.choice(string.ascii_lowercase) for _ in range(8))
+                next_id += 1
+            elif roll < 2 * share:
+                username += "x"
+            elif roll < 3 * share:
+                premium = not premium
+            elif roll < 0.5:
+                was_online = now - rng.randint(0, 3600)
+            self.users[i] = (user_id, username, first_name, last_name, premium, was_online)
+        self._index()
+
+    def _user(self, i):
+        user_id, username, first_name, last_name, premium, was_online = self.users[i]
+        return types.User(
+            id=user_id, access_hash=user_id, username=username, first_name=first_name,
+            last_name=last_name, premium=premium,
+            status=types.UserStatusOffline(was_online=datetime.fromtimestamp(was_online))
+        )
+
+    async def _rpc(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_rate and self._rng.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+
+    def _search(self, query):
+        if query not in self._searches:
+            if query:
+                start = bisect_left(self._usernames, query)
+                end = bisect_left(self._usernames, query + "\U0010ffff")
+                matches = [i for _, i in self._by_username[start:end]]
+            else:
+                matches = range(len(self.users))
+            self._searches[query] = matches
+        return self._searches[query]
+
+    def is_connected(self):
+        return True
+
+    async def connect(self):
+        pass
+
+    async def __call__(self, request):
+        if isinstance(request, functions.PingRequest):
+            return types.Pong(msg_id=0, ping_id=request.ping_id)
+        await self._rpc(type(request).__name__)
+        if isinstance(request, functions.channels.GetParticipantsRequest):
+            matches = self._search(request.filter.q.lower())
+            # Like Telegram, no single query returns more than `search_cap` users
+            end = min(request.offset + request.limit, self.search_cap)
+            users = [self._user(i) for i in matches[request.offset:end]] if request.offset < end else []
+            return types.channels.ChannelParticipants(count=len(self.users), participants=[], chats=[], users=users)
+        if isinstance(request, functions.users.GetUsersRequest):
+            return [self._user(peer.user_id - FIRST_USER_ID) for peer in request.id]
+        raise NotImplementedError(type(request).__name__)
+
+    async def get_entity(self, key):
+        await self._rpc("get_entity")
+        return self.channel
+
+    async def get_input_entity(self, peer):
+        return types.InputUser(peer.user_id, peer.user_id)
+
+    def _commenter(self, post_id, j):
+        return (post_id * 7919 + j * 104729) % len(self.users)
+
+    async def get_messages(self, entity, limit=100, reply_to=None, min_id=0, offset_id=0, **kwargs):
+        await self._rpc("get_messages")
+        now = datetime.now()
+        # Like Telegram, messages come newest (highest id) first, older than `offset_id`
+        if reply_to is None:
+            newest = min(self.posts, offset_id - 1) if offset_id else self.posts
+            return [
+                SimpleNamespace(
+                    id=post_id, from_id=None, sender=None, text=f"Post {post_id}",
+                    date=now - timedelta(hours=self.posts - post_id),
+                    replies=types.MessageReplies(
+                        replies=self.replies_per_post, replies_pts=0,
+                        max_id=post_id * 100_000 + self.replies_per_post
+                    )
+                )
+                for post_id in range(newest, max(newest - limit, 0), -1)
+            ]
+        replies = []
+        for j in range(1, self.replies_per_post + 1):
+            reply_id = reply_to * 100_000 + j
+            if reply_id <= min_id or (offset_id and reply_id >= offset_id):
+                continue
+            i = self._commenter(reply_to, j)
+            replies.append(SimpleNamespace(
+                id=reply_id, from_id=types.PeerUser(self.users[i][0]),
+                # Telegram leaves out some authors; those are looked up with GetUsers
+                sender=self._user(i) if j % 10 else None,
+                text=f"Reply {j}", date=now, reply_to_msg_id=reply_to
+            ))
+        replies = replies[-limit:][::-1]
+        self.replies_served += len(replies)
+        return replies
+
+    async def disconnect(self):
+        pass
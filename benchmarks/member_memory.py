@@ -0,0 +1,78 @@
+"""Memory used by parsed members, per-user dicts vs. `records.Member`.
+
+Run from the project root:
+
+    python benchmarks/member_memory.py [count]
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import Member, format_last_seen  # noqa: E402
+
+FIRST_NAMES = ["Alex", "Maria", "Ivan", "Olga", "John", "Anna", "Dmytro", "Sofia", "Max", "Elena"]
+LAST_NAMES = ["Smith", "Ivanova", "Kovalenko", None, "Brown", "Petrov", None, "Garcia"]
+
+
+def fake_users(count):
+    rng = random.Random(42)
+    now = time.time()
+    for user_id in range(10_000_000, 10_000_000 + count):
+        # Telethon decodes every name into a new string object, as done here
+        first = "".join(rng.choice(FIRST_NAMES))
+        last = rng.choice(LAST_NAMES)
+        yield SimpleNamespace(
+            id=user_id,
+            username=f"user{user_id}" if rng.random() < 0.7 else None,
+            first_name=first,
+            last_name="".join(last) if last else None,
+            premium=rng.random() < 0.05,
+            phone=None,
+            status=SimpleNamespace(was_online=datetime.fromtimestamp(now - rng.randint(0, 30 * 86400)))
+        )
+
+
+def as_dict(user):
+    # The per-user dict /parse used to build
+    return {
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'premium': user.premium,
+        'phone': user.phone,
+        'last_seen': format_last_seen(user.status.was_online.timestamp())
+    }
+
+
+def measure(build, users):
+    tracemalloc.start()
+    records = [build(user) for user in users]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return records, current
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    users = list(fake_users(count))
+
+    dicts, dict_bytes = measure(as_dict, users)
+    members, member_bytes = measure(Member.from_user, users)
+    dict_json = sum(len(json.dumps(row)) for row in dicts)
+    member_json = sum(len(json.dumps(member.to_row())) for member in members)
+
+    print(f"{count} users")
+    print(f"  in memory:  dicts {dict_bytes / 2**20:7.1f} MiB   Member {member_bytes / 2**20:7.1f} MiB")
+    print(f"  stored:     dicts {dict_json / 2**20:7.1f} MiB   Member {member_json / 2**20:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
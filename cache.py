@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from telethon import utils
+from typing import Any, Hashable, Optional
+import time
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl
+        }
+
+
+def normalize_key(key: str):
+    """The same chat given as `@name`, `t.me/name`, a link or an id maps to one key."""
+    key = key.strip().lower()
+    for prefix in ("https://", "http://", "t.me/", "@"):
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    return int(key) if key.lstrip("-").isdigit() else key
+
+
+def entity_key(client, key) -> Optional[tuple]:
+    """Cache key for `key` as seen by `client`.
+
+    Access hashes are per account, so an entity resolved by one session must
+    not be handed to another; keys are namespaced by the client instance.
+    """
+    if isinstance(key, str):
+        key = normalize_key(key)
+    elif not isinstance(key, int):
+        # Peers and entities map onto their marked id (-100... for channels)
+        try:
+            key = utils.get_peer_id(key)
+        except (TypeError, ValueError):
+            return None
+    return (id(client), key)
+
+
+async def get_entity_cached(cache: TTLCache, client, key, limiter=None):
+    """`client.get_entity(key)` served from `cache` when possible."""
+    cache_key = entity_key(client, key)
+    entity = cache.get(cache_key) if cache_key else None
+    if entity is not None:
+        return entity
+    entity = await limiter.call(client.get_entity, key) if limiter else await client.get_entity(key)
+    if cache_key:
+        cache.set(cache_key, entity)
+    peer_key = entity_key(client, entity)
+    if peer_key and peer_key != cache_key:
+        cache.set(peer_key, entity)
+    return entity
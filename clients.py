@@ -0,0 +1,214 @@
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import itertools
+import logging
+import random
+import time
+
+from telethon import TelegramClient, errors, functions
+
+logger = logging.getLogger(__name__)
+
+# Telegram API credentials
+API_ID = 24051818
+API_HASH = "a86f5da90e15c17c78e388003925b3a4"
+
+
+async def start_bot_client(token, session_name):
+    bot_client = TelegramClient(session_name, API_ID, API_HASH)
+    try:
+        await bot_client.start(bot_token=token)
+        logger.info(f"Bot {session_name} successfully authenticated!")
+    except Exception as e:
+        logger.error(f"Error starting bot: {str(e)}")
+        raise
+    return bot_client
+
+
+async def start_user_client(session_file):
+    user_client = TelegramClient(
+        session_file,
+        API_ID,
+        API_HASH,
+        device_model="Samsung Galaxy S20",
+        system_version="Android 12",
+        app_version="8.4.1",
+        lang_code="en",
+        system_lang_code="en"
+    )
+    try:
+        await user_client.connect()
+        if not await user_client.is_user_authorized():
+            logger.warning(f"User authentication required for {session_file}!")
+            await user_client.disconnect()
+            return None
+        logger.info(f"User {session_file} successfully authenticated!")
+    except Exception as e:
+        logger.error(f"Error starting user client: {str(e)}")
+        raise
+    return user_client
+
+
+class PooledClient:
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.active = 0
+        self.leases = 0
+        self.blocked_until = 0.0
+        # Cleared when the connection failed a health check
+        self.healthy = True
+        self.checked_at: Optional[float] = None
+
+    @property
+    def blocked(self) -> bool:
+        return self.blocked_until > time.monotonic()
+
+    def status_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "active": self.active,
+            "leases": self.leases,
+            "blocked_for": max(0, round(self.blocked_until - time.monotonic(), 1)),
+            "healthy": self.healthy,
+            "checked_at": self.checked_at
+        }
+
+
+class ClientPool:
+    """Hands out Telegram clients from several sessions to crawl jobs.
+
+    Clients are picked least-loaded first (ties broken round-robin), or purely
+    round-robin, unless the caller names one that is available. A client that got a FloodWaitError is taken out of rotation
+    until the wait is over; if every client is blocked, `acquire` waits for
+    the first one to come back. Clients whose connection failed a `check`
+    are left out until a later check gets them back, and clients that failed
+    to start are started again by each `check`.
+    """
+
+    def __init__(self, name: str, strategy: str = "least_loaded"):
+        self.name = name
+        self.strategy = strategy
+        self.clients: List[PooledClient] = []
+        self._turn = itertools.count()
+        self._lock = asyncio.Lock()
+        self._start_lock = asyncio.Lock()
+        # Starters that raised, by client name, to be retried
+        self._failed: Dict[str, Callable[[], Awaitable[Optional[object]]]] = {}
+
+    async def add(self, name: str, start: Callable[[], Awaitable[Optional[object]]]):
+        """Start a client with `start()` and add it, unless it returned None (not authorized)."""
+        try:
+            client = await start()
+        except Exception as e:
+            logger.error(f"Error starting {self.name} client {name}: {str(e)}")
+            self._failed[name] = start
+            return
+        self._failed.pop(name, None)
+        if client is not None:
+            self.clients.append(PooledClient(name, client))
+
+    async def start(self, starters: Dict[str, Callable[[], Awaitable[Optional[object]]]]) -> "ClientPool":
+        """Start the clients of an empty pool, once however many callers ask at the same time.
+
+        Two clients on one session file would corrupt it, so callers that
+        arrive while the pool is starting wait for it instead.
+        """
+        async with self._start_lock:
+            if not self.clients:
+                await asyncio.gather(*(self.add(name, start) for name, start in starters.items()))
+        return self
+
+    @property
+    def ready(self) -> bool:
+        return any(pooled.healthy for pooled in self.clients)
+
+    def _pick(self, name: Optional[str] = None) -> Optional[PooledClient]:
+        available = [pooled for pooled in self.clients if pooled.healthy and not pooled.blocked]
+        if not available:
+            return None
+        # A client asked for by name (e.g. the one that resolved a job's chat) is used while available
+        for pooled in available:
+            if pooled.name == name:
+                return pooled
+        turn = next(self._turn)
+        rotated = available[turn % len(available):] + available[:turn % len(available)]
+        if self.strategy == "round_robin":
+            return rotated[0]
+        return min(rotated, key=lambda pooled: pooled.active)
+
+    async def acquire(self, name: Optional[str] = None) -> Optional[PooledClient]:
+        if not self.clients:
+            return None
+        while True:
+            async with self._lock:
+                pooled = self._pick(name)
+                if pooled:
+                    pooled.active += 1
+                    pooled.leases += 1
+                    return pooled
+                if not self.ready:
+                    return None
+                wait = min(pooled.blocked_until for pooled in self.clients if pooled.healthy) - time.monotonic()
+            # Wait outside the lock, so releases and health checks go on meanwhile
+            logger.warning(f"All {self.name} clients are rate limited, waiting {wait:.0f}s")
+            await asyncio.sleep(max(wait, 0.1))
+
+    def release(self, pooled: PooledClient):
+        pooled.active -= 1
+
+    def block(self, pooled: PooledClient, seconds: float):
+        pooled.blocked_until = max(pooled.blocked_until, time.monotonic() + seconds)
+        logger.warning(f"{self.name} client {pooled.name} is out of rotation for {seconds}s")
+
+    def block_client(self, client, seconds: float):
+        for pooled in self.clients:
+            if pooled.client is client:
+                self.block(pooled, seconds)
+
+    async def check(self, timeout: float = 10):
+        """Start again the clients that failed to start, then ping every
+        client, reconnecting the ones whose connection dropped."""
+        if self._failed:
+            async with self._start_lock:
+                await asyncio.gather(*(self.add(name, start) for name, start in list(self._failed.items())))
+        for pooled in self.clients:
+            try:
+                if not pooled.client.is_connected():
+                    logger.warning(f"{self.name} client {pooled.name} is disconnected, reconnecting")
+                    await asyncio.wait_for(pooled.client.connect(), timeout)
+                try:
+                    await asyncio.wait_for(pooled.client(functions.PingRequest(ping_id=random.getrandbits(63))), timeout)
+                except errors.RPCError:
+                    # Telegram answered, so the connection is fine
+                    pass
+                if not pooled.healthy:
+                    logger.info(f"{self.name} client {pooled.name} is back")
+                pooled.healthy = True
+            except Exception as e:
+                if pooled.healthy:
+                    logger.error(f"{self.name} client {pooled.name} failed its health check: {str(e)}")
+                pooled.healthy = False
+            pooled.checked_at = time.time()
+
+    @asynccontextmanager
+    async def lease(self, name: Optional[str] = None):
+        pooled = await self.acquire(name)
+        try:
+            yield pooled
+        finally:
+            if pooled:
+                self.release(pooled)
+
+    async def stop(self):
+        for pooled in self.clients:
+            await pooled.client.disconnect()
+        self.clients = []
+
+    def stats(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "clients": [pooled.status_dict() for pooled in self.clients],
+            "failed": sorted(self._failed)
+        }
@@ -0,0 +1,214 @@
+"""Crawl chat members or channel comments from the command line.
+
+Runs the web app's crawlers without the web app (FastAPI and the templates
+are never imported) and writes each chat to its own NDJSON or Parquet file:
+
+    python crawl.py members @chat --bot --output "{target}.parquet"
+    python crawl.py members -f chats.txt --exhaustive --bot --session bot_a --session bot_b
+    python crawl.py comments @channel --limit 100 --session telegram_session --output comments.ndjson
+
+With several --session options the targets are split between as many
+processes, each on its own session: a session file can't be used by two
+processes at once. User sessions are made with `python auth.py <path>`;
+with --bot, session N logs in with the Nth token of BOT_TOKEN.
+
+Crawls are staged in a result store, in memory unless --store names a
+SQLite file. With a file, running the same command again continues
+unfinished crawls from their checkpoints.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from cache import TTLCache, normalize_key
+from clients import start_bot_client, start_user_client
+from crawler import Crawler
+from export import CHUNK_SIZE, COMMENT_FIELDS, MEMBER_FIELDS, iter_ndjson, write_parquet
+from jobs import Job
+from ratelimit import CrawlSuspended, RateLimiter
+from records import Member
+from storage import open_store
+
+logger = logging.getLogger("crawl")
+
+HEARTBEAT_SECONDS = 30
+
+
+def output_path(template: str, target: str) -> str:
+    name = str(normalize_key(target)).replace("/", "_")
+    return template.replace("{target}", name)
+
+
+def write_output(store, job, path: str) -> int:
+    chunks = store.iter_chunks(job.id, CHUNK_SIZE)
+    if job.kind == "parse":
+        chunks = ([Member.from_row(row) for row in chunk] for chunk in chunks)
+    if path.endswith(".parquet"):
+        return write_parquet(path, chunks, MEMBER_FIELDS if job.kind == "parse" else COMMENT_FIELDS)
+    count = 0
+    with open(path, "w", encoding="utf-8") as output:
+        for chunk in chunks:
+            output.write("".join(iter_ndjson([chunk])))
+            count += len(chunk)
+    return count
+
+
+def load_job(store, kind: str, target: str, params: dict) -> Job:
+    """The unfinished crawl of `target` saved in the store, or a new one."""
+    job_id = f"cli:{kind}:{normalize_key(target)}"
+    data = store.get_job(job_id)
+    if data and data["status"] != "done":
+        logger.info(f"Continuing the crawl of {target} from its checkpoint")
+        return Job.model_validate(data)
+    if store.get(job_id):
+        store.delete(job_id)
+    store.create(kind, {"params": params}, result_id=job_id)
+    return Job(id=job_id, kind=kind, params=params, created_at=time.time())
+
+
+async def crawl_target(crawler, client, limiter, kind, target, args):
+    if kind == "parse":
+        params = {"chat_id": target, "exhaustive": args.exhaustive, "max_users": args.max_users}
+        crawl = crawler.crawl_members
+    else:
+        params = {
+            "channel_id": target, "limit": args.limit, "max_replies": args.max_replies,
+            "days": args.days, "incremental": False
+        }
+        crawl = crawler.crawl_comments
+    job = load_job(crawler.store, kind, target, params)
+    job.status = "running"
+    job.started_at = job.started_at or time.time()
+    while True:
+        try:
+            await crawl(job, client, limiter)
+            break
+        except CrawlSuspended as e:
+            logger.warning(f"Rate limited while crawling {target}, waiting {int(e.seconds)}s")
+            job.status = "suspended"
+            crawler.checkpoint(job)
+            await asyncio.sleep(e.seconds)
+            job.status = "running"
+    job.status = "done"
+    job.finished_at = time.time()
+    crawler.checkpoint(job)
+
+    path = output_path(args.output, target)
+    count = write_output(crawler.store, job, path)
+    logger.info(f"{target}: wrote {count} rows to {path} in {job.finished_at - job.started_at:.1f}s")
+
+
+async def heartbeat(store, owner):
+    # Keeps a web app sharing the store from taking over these crawls
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        store.touch_jobs(owner)
+
+
+async def crawl_targets(kind, targets, session, bot_token, args) -> int:
+    """Crawl `targets` one after another on one session; returns how many failed."""
+    if bot_token:
+        client = await start_bot_client(bot_token, session)
+    else:
+        client = await start_user_client(session)
+        if client is None:
+            raise SystemExit(f"{session} is not logged in; run `python auth.py {session}` first")
+
+    store = open_store(args.store)
+    owner = f"cli-{os.getpid()}"
+    crawler = Crawler(
+        store,
+        TTLCache(maxsize=50000, ttl=3600),
+        lambda job: store.save_job(job.id, job.kind, job.status, owner, job.model_dump())
+    )
+    limiter = RateLimiter(
+        rate=float(os.getenv('TELEGRAM_RATE', '10')),
+        max_rate=float(os.getenv('TELEGRAM_MAX_RATE', '30')),
+        max_inline_wait=float(os.getenv('MAX_INLINE_FLOOD_WAIT', '60')),
+        max_retries=int(os.getenv('TELEGRAM_MAX_RETRIES', '5'))
+    ).session(client, os.path.basename(session))
+    beat = asyncio.create_task(heartbeat(store, owner))
+
+    failed = 0
+    try:
+        for target in targets:
+            try:
+                await crawl_target(crawler, client, limiter, kind, target, args)
+            except Exception as e:
+                logger.error(f"Error crawling {target}: {str(e)}")
+                failed += 1
+    finally:
+        beat.cancel()
+        await client.disconnect()
+    return failed
+
+
+def run_worker(kind, targets, session, bot_token, args) -> int:
+    setup_logging()
+    return asyncio.run(crawl_targets(kind, targets, session, bot_token, args))
+
+
+def setup_logging():
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=["members", "comments"])
+    parser.add_argument("targets", nargs="*", help="chat IDs, usernames or links")
+    parser.add_argument("-f", "--targets-file", help="file with one target per line")
+    parser.add_argument("--output", help='output file, written as Parquet if it ends in .parquet; '
+                                         '"{target}" is replaced by the chat name (default: {target}.ndjson)')
+    parser.add_argument("--session", action="append", help="session file to crawl with; repeat to use several processes")
+    parser.add_argument("--bot", action="store_true", help="log the sessions in as the bots in BOT_TOKEN")
+    parser.add_argument("--store", default=":memory:", help="SQLite file to stage crawls in, to resume them")
+    parser.add_argument("--exhaustive", action="store_true", help="members: also search by name in large chats")
+    parser.add_argument("--max-users", type=int, help="members: stop after this many users per chat")
+    parser.add_argument("--limit", type=int, default=10, help="comments: number of recent posts")
+    parser.add_argument("--max-replies", type=int, help="comments: replies read per post (default: all)")
+    parser.add_argument("--days", type=int, help="comments: only posts from the last N days")
+    args = parser.parse_args()
+    setup_logging()
+
+    targets = list(args.targets)
+    if args.targets_file:
+        with open(args.targets_file, encoding="utf-8") as targets_file:
+            targets += [line.strip() for line in targets_file if line.strip() and not line.startswith("#")]
+    if not targets:
+        parser.error("no targets given")
+    args.output = args.output or "{target}.ndjson"
+    if len(targets) > 1 and "{target}" not in args.output:
+        parser.error('--output must contain "{target}" when crawling several chats')
+
+    if args.bot:
+        tokens = [token.strip() for token in os.getenv('BOT_TOKEN', '').split(',') if token.strip()]
+        sessions = args.session or [f"cli_bot_session_{i + 1}" for i in range(len(tokens))]
+        if len(tokens) < len(sessions) or not tokens:
+            parser.error("--bot needs a BOT_TOKEN for every session")
+    else:
+        tokens = []
+        sessions = args.session or [os.path.join(os.getcwd(), "telegram_session")]
+    if args.store == ":memory:" and len(sessions) > 1:
+        logger.info("Each process stages its crawls in memory; use --store to make them resumable")
+
+    kind = "parse" if args.kind == "members" else "comments"
+    sessions = sessions[:len(targets)]
+    shares = [targets[i::len(sessions)] for i in range(len(sessions))]
+    bot_tokens = tokens[:len(sessions)] if tokens else [None] * len(sessions)
+    if len(sessions) == 1:
+        failed = asyncio.run(crawl_targets(kind, shares[0], sessions[0], bot_tokens[0], args))
+    else:
+        with ProcessPoolExecutor(max_workers=len(sessions)) as pool:
+            failed = sum(pool.map(run_worker, [kind] * len(sessions), shares, sessions, bot_tokens, [args] * len(sessions)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
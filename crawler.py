@@ -0,0 +1,529 @@
+"""Member and comment crawlers, shared by the web app and `crawl.py`.
+
+Crawls run as `jobs.Job`s: they store rows in a `storage.ResultStore` as
+they go and keep their progress in `job.checkpoint`, so a crawl that was
+suspended or interrupted continues where it stopped. Nothing here imports
+the web stack.
+"""
+from datetime import datetime, timedelta
+from telethon import functions, types, utils
+from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.types import ChannelParticipantsSearch
+import asyncio
+import logging
+import os
+
+from cache import TTLCache, entity_key, get_entity_cached
+from metrics import metrics
+from ratelimit import CrawlSuspended
+from records import Member
+from storage import ResultStore
+
+logger = logging.getLogger(__name__)
+
+# Exhaustive member scans search by name prefix, since a single participant
+# query stops returning users at about 10k
+MEMBER_SEARCH_ALPHABET = (
+    "abcdefghijklmnopqrstuvwxyz"
+    "0123456789"
+    "абвгдеёжзийклмнопрстуфхцчшщэюяіїєґ"
+    "αβγδεζηθικλμνξοπρστυφχψω"
+    "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+)
+MEMBER_SEARCH_CAP = int(os.getenv('MEMBER_SEARCH_CAP', '10000'))
+MEMBER_SEARCH_MAX_PREFIX = int(os.getenv('MEMBER_SEARCH_MAX_PREFIX', '3'))
+MEMBER_SEARCH_CONCURRENCY = int(os.getenv('MEMBER_SEARCH_CONCURRENCY', '4'))
+
+# Number of posts whose replies are fetched at the same time by comment crawls
+COMMENTS_CONCURRENCY = int(os.getenv('COMMENTS_CONCURRENCY', '8'))
+
+
+def target_reached(job):
+    """Whether a batch target reached its `max_users` limit."""
+    max_users = job.params.get('max_users')
+    return bool(max_users) and job.users_seen >= max_users
+
+
+# Fields of `comment_row` holding each of `storage.PROFILE_FIELDS`, which are
+# kept in the store's user registry; comments don't show phone numbers
+COMMENT_USER_FIELDS = ('username', 'first_name', 'last_name', 'is_premium', None)
+
+
+def comment_row(post, post_author: str, comment, author, post_id=None) -> dict:
+    """The stored row of a comment on `post` (the channel post `post_id`),
+    which is kept per commenter."""
+    return {
+        'post_id': post_id or post.id,
+        'post_author': post_author,
+        'post_date': post.date.strftime("%Y-%m-%d %H:%M:%S"),
+        'post_text': post.text[:100] + "..." if len(post.text) > 100 else post.text,
+        'comment_id': comment.id,
+        'user_id': author.id,
+        'username': author.username,
+        'first_name': author.first_name,
+        'last_name': author.last_name if hasattr(author, 'last_name') else None,
+        'text': comment.text,
+        'date': comment.date.strftime("%Y-%m-%d %H:%M:%S"),
+        'reply_to': comment.reply_to_msg_id if hasattr(comment, 'reply_to_msg_id') else None,
+        'is_premium': bool(getattr(author, 'premium', False))
+    }
+
+
+def comment_record(post_id: int, comment, author) -> dict:
+    """A comment as kept in full when a crawl keeps every comment."""
+    return {
+        'comment_id': comment.id,
+        'post_id': post_id,
+        'user_id': author.id,
+        'username': author.username,
+        'date': comment.date.timestamp(),
+        'text': comment.text
+    }
+
+
+def has_new_replies(message, last_reply_id):
+    """Whether a post has replies newer than `last_reply_id`, judged from the post itself."""
+    replies = getattr(message, 'replies', None)
+    if replies is None:
+        # No reply info on the post; only a fetch can tell
+        return True
+    return (replies.max_id or 0) > last_reply_id
+
+
+class Crawler:
+    """Runs member and comment crawls into `store`.
+
+    `checkpoint(job)` is called whenever a crawl made progress worth
+    keeping; the web app saves the job there, so it can be resumed by
+    another process. Resolved chats and users are shared through
+    `entity_cache`.
+    """
+
+    def __init__(self, store: ResultStore, entity_cache: TTLCache, checkpoint=None):
+        self.store = store
+        self.entity_cache = entity_cache
+        self.checkpoint = checkpoint or (lambda job: None)
+
+    async def crawl_member_query(self, job, client, entity, query, limiter, seen_ids):
+        """Page through one participant search query and store the users it returns.
+
+        The offset reached is kept in `job.checkpoint`, so a suspended query
+        picks up where it stopped. Returns how many users the query returned,
+        duplicates included.
+        """
+        offsets = job.checkpoint.setdefault('offsets', {})
+        offset = offsets.get(query, 0)
+        limit = 100
+        result_id = job.params.get('result_id', job.id)
+        source = job.params.get('source')
+        
+        while not target_reached(job):
+            logger.debug(f"Fetching members batch (query: {query!r}, offset: {offset}, limit: {limit})...")
+            with metrics.time("fetch_members_page", job):
+                participants = await limiter.call(client, GetParticipantsRequest(
+                    channel=entity,
+                    filter=ChannelParticipantsSearch(query),
+                    offset=offset,
+                    limit=limit,
+                    hash=0
+                ))
+            
+            if not participants.users:
+                break
+            
+            job.pages_fetched += 1
+            if query == '':
+                job.total_expected = participants.count
+            with metrics.time("build_records", job):
+                batch = []
+                for user in participants.users:
+                    if user.id in seen_ids:
+                        job.stats['duplicates'] += 1
+                        continue
+                    if target_reached(job):
+                        break
+                    seen_ids.add(user.id)
+                    job.users_seen += 1
+                    # Every member is stored; filters are applied when the result is viewed
+                    batch.append(Member.from_user(user).to_row())
+            
+            with metrics.time("store", job):
+                job.users_kept += self.store.append(result_id, batch, key=0, user_fields=Member.PROFILE_FIELDS)
+                if source:
+                    self.store.add_sources(result_id, source, [row[0] for row in batch])
+            offset += len(participants.users)
+            offsets[query] = offset
+            with metrics.time("checkpoint", job):
+                self.checkpoint(job)
+            if len(participants.users) < limit:
+                break
+        
+        offsets.pop(query, None)
+        job.stats['queries'] += 1
+        return offset
+
+    async def crawl_members_exhaustive(self, job, client, entity, limiter, seen_ids):
+        """Fan out over search prefixes to get past the cap on a single member query.
+
+        Every prefix whose results were capped is refined with one more
+        character, up to MEMBER_SEARCH_MAX_PREFIX characters. Prefixes still to
+        search are kept in `job.checkpoint` until their query completes.
+        """
+        pending = job.checkpoint.setdefault('prefixes', list(MEMBER_SEARCH_ALPHABET))
+        queue = asyncio.Queue()
+        for prefix in pending:
+            queue.put_nowait(prefix)
+
+        async def worker():
+            while True:
+                prefix = await queue.get()
+                try:
+                    fetched = await self.crawl_member_query(job, client, entity, prefix, limiter, seen_ids)
+                    if fetched >= MEMBER_SEARCH_CAP and len(prefix) < MEMBER_SEARCH_MAX_PREFIX:
+                        for char in MEMBER_SEARCH_ALPHABET:
+                            pending.append(prefix + char)
+                            queue.put_nowait(prefix + char)
+                    pending.remove(prefix)
+                    self.checkpoint(job)
+                except CrawlSuspended:
+                    raise
+                except Exception as e:
+                    pending.remove(prefix)
+                    job.stats['failed_queries'] += 1
+                    logger.error(f"Error fetching members for prefix {prefix!r}: {str(e)}")
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(MEMBER_SEARCH_CONCURRENCY)]
+        joined = asyncio.create_task(queue.join())
+        try:
+            # A worker only stops early when the crawl is suspended
+            done, _ = await asyncio.wait(workers + [joined], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not joined:
+                    task.result()
+        finally:
+            for task in workers + [joined]:
+                task.cancel()
+            await asyncio.gather(*workers, joined, return_exceptions=True)
+
+    async def crawl_members(self, job, client, limiter, peer=None):
+        """Store the members of `job.params['chat_id']`. `peer` is the chat's
+        id when `client` has resolved it before, as for batch targets."""
+        params = job.params
+
+        logger.info(f"Starting to parse chat: {params['chat_id']}")
+        # Get chat entity
+        logger.debug("Getting chat entity...")
+        with metrics.time("resolve_entity", job):
+            if peer is not None:
+                # The session kept the chat's access hash, so this is normally not a request
+                entity = self.entity_cache.get(entity_key(client, peer)) or await limiter.call(client.get_input_entity, peer)
+            else:
+                entity = await get_entity_cached(self.entity_cache, client, params['chat_id'], limiter)
+        logger.info(f"Found chat: {entity.title if hasattr(entity, 'title') else params['chat_id']}")
+        
+        # Users are deduplicated by id across all queries of the job, including
+        # the ones stored before the job was suspended. A batch target only
+        # skips the users already found in the same chat.
+        if params.get('source'):
+            seen_ids = {int(key) for key in self.store.source_keys(params['result_id'], params['source'])}
+        else:
+            seen_ids = {int(key) for key in self.store.keys(job.id)}
+        if not job.stats:
+            job.stats = {'queries': 0, 'failed_queries': 0, 'duplicates': 0, 'flood_waits': 0}
+        
+        try:
+            if not job.checkpoint.get('base_done'):
+                logger.debug("Starting to fetch members...")
+                await self.crawl_member_query(job, client, entity, '', limiter, seen_ids)
+                job.checkpoint['base_done'] = True
+                self.checkpoint(job)
+            
+            if params.get('exhaustive') and job.total_expected and len(seen_ids) < job.total_expected and not target_reached(job):
+                logger.info(f"Got {len(seen_ids)} of {job.total_expected} members, searching by name prefixes...")
+                await self.crawl_members_exhaustive(job, client, entity, limiter, seen_ids)
+        finally:
+            job.stats['flood_waits'] += limiter.flood_waits
+        
+        job.stats['distinct_users'] = len(seen_ids)
+        if not params.get('source'):
+            # Crawls of the same chat are found by its id, to compare them
+            self.store.update_meta(
+                job.id,
+                coverage=job.stats,
+                chat={"id": utils.get_peer_id(entity), "title": getattr(entity, 'title', None)},
+                crawled_at=datetime.now().isoformat()
+            )
+        logger.info(f"Parsing completed. Found {job.users_kept} matching users.")
+        logger.info(f"Coverage: {job.stats}")
+
+    async def resolve_missing_users(self, client, peers, limiter, stats):
+        """Resolve users that were not bundled with a response in one users.GetUsers call."""
+        found = {}
+        uncached = []
+        for peer in peers:
+            user = self.entity_cache.get(entity_key(client, peer))
+            if user is not None:
+                found[user.id] = user
+            else:
+                uncached.append(peer)
+        if not uncached:
+            return found
+        input_users = []
+        for peer in uncached:
+            try:
+                # Usually answered from the session, but a miss is a request
+                input_users.append(await limiter.call(client.get_input_entity, peer))
+            except Exception as e:
+                logger.error(f"Error getting input entity for {peer}: {str(e)}")
+        if not input_users:
+            return found
+        users = await limiter.call(client, functions.users.GetUsersRequest(input_users))
+        stats['rpcs'] += 1
+        for user in users:
+            if isinstance(user, types.User):
+                self.entity_cache.set(entity_key(client, user), user)
+                found[user.id] = user
+        return found
+
+    async def iter_posts(self, job, client, entity, limiter, limit, since=None):
+        """Yield the channel's last `limit` posts, newest first, a page at a time.
+
+        Stops at the first post older than `since`.
+        """
+        offset_id = 0
+        remaining = limit
+        while remaining > 0:
+            with metrics.time("fetch_posts", job):
+                page = await limiter.call(client.get_messages, entity, limit=min(remaining, 100), offset_id=offset_id)
+            page = [message for message in page if message and message.id and (not offset_id or message.id < offset_id)]
+            for message in page:
+                if since and message.date.replace(tzinfo=None) < since:
+                    return
+                yield message
+            if len(page) < min(remaining, 100):
+                return
+            remaining -= len(page)
+            offset_id = page[-1].id
+
+    async def iter_replies(self, job, client, entity, post_id, limiter, min_id=0, max_replies=None):
+        """Yield pages of the replies to a post newer than `min_id`, newest first.
+
+        Replies are fetched 100 at a time through the rate limiter, and only
+        one page is held at a time, however long the thread.
+        """
+        offset_id = 0
+        fetched = 0
+        while not max_replies or fetched < max_replies:
+            limit = min(100, max_replies - fetched) if max_replies else 100
+            with metrics.time("fetch_replies", job):
+                page = await limiter.call(
+                    client.get_messages, entity, reply_to=post_id, limit=limit, offset_id=offset_id, min_id=min_id
+                )
+            page = [comment for comment in page if comment and comment.id > min_id and (not offset_id or comment.id < offset_id)]
+            if not page:
+                return
+            job.stats['reply_pages'] += 1
+            fetched += len(page)
+            yield page
+            if len(page) < limit:
+                return
+            offset_id = page[-1].id
+        job.stats['capped_posts'] += 1
+
+    async def resolve_authors(self, job, client, items, limiter):
+        """Authors of the messages in `items`, taken from the users bundled with
+        the messages where possible and looked up in one request otherwise."""
+        authors = {}
+        missing = {}
+        for item in items:
+            if not isinstance(item.from_id, types.PeerUser):
+                continue
+            job.stats['lookups'] += 1
+            if isinstance(item.sender, types.User):
+                authors[item.sender.id] = item.sender
+                self.entity_cache.set(entity_key(client, item.sender), item.sender)
+            else:
+                missing[item.from_id.user_id] = item.from_id
+        missing = [peer for user_id, peer in missing.items() if user_id not in authors]
+        if missing:
+            with metrics.time("resolve_authors", job):
+                authors.update(await self.resolve_missing_users(client, missing, limiter, job.stats))
+        return authors
+
+    async def crawl_post(self, job, client, entity, message, limiter, kept, min_id=0):
+        """Page through the replies to one post, storing each commenter's
+        comment (and every comment, with `all_comments`) as it goes.
+        Returns the highest reply id seen.
+
+        `kept` maps the users in the result to the (post id, comment id) of
+        their stored comment, or None for users of an earlier crawl, which
+        are left alone. A user's comment on the newest post, and their newest
+        one there, is kept, as a serial crawl would, whatever order the
+        posts finish in.
+        """
+        try:
+            post_authors = await self.resolve_authors(job, client, [message], limiter)
+        except CrawlSuspended:
+            raise
+        except Exception as e:
+            logger.error(f"Error resolving the author of message {message.id}: {str(e)}")
+            post_authors = {}
+        if isinstance(message.from_id, types.PeerUser):
+            post_author = post_authors.get(message.from_id.user_id)
+            if post_author is None:
+                post_author_username = "Unknown"
+            else:
+                post_author_username = f"@{post_author.username}" if post_author.username else "Anonymous"
+        else:
+            post_author_username = "Anonymous"
+        
+        last_reply_id = min_id
+        async for page in self.iter_replies(job, client, entity, message.id, limiter, min_id, job.params.get('max_replies')):
+            last_reply_id = max(last_reply_id, max(comment.id for comment in page))
+            # Comments from channels or anonymous admins have no user author
+            comments = [comment for comment in page if isinstance(comment.from_id, types.PeerUser)]
+            try:
+                authors = await self.resolve_authors(job, client, comments, limiter)
+            except CrawlSuspended:
+                raise
+            except Exception as e:
+                logger.error(f"Error resolving authors of replies to message {message.id}: {str(e)}")
+                authors = {}
+            
+            rows = []
+            records = []
+            for comment in comments:
+                author = authors.get(comment.from_id.user_id)
+                if author is None:
+                    logger.warning(f"Error processing comment {comment.id}: author not found")
+                    continue
+                job.users_seen += 1
+                if job.params.get('all_comments'):
+                    records.append(comment_record(message.id, comment, author))
+                rank = (message.id, comment.id)
+                best = kept.get(str(author.id), ())
+                if best is None or best >= rank:
+                    continue
+                kept[str(author.id)] = rank
+                rows.append(comment_row(message, post_author_username, comment, author))
+            with metrics.time("store", job):
+                if records:
+                    job.stats['comments_kept'] = job.stats.get('comments_kept', 0) + self.store.add_comments(job.id, records)
+                job.users_kept += self.store.merge(
+                    job.id, rows, 'user_id', ('post_id', 'comment_id'), job.checkpoint['first_seq'],
+                    user_fields=COMMENT_USER_FIELDS
+                )
+        return last_reply_id
+
+    async def crawl_comments(self, job, client, limiter):
+        """Collect the commenters of a channel's recent posts.
+
+        Posts and their replies are paged through and stored as they
+        arrive, with up to COMMENTS_CONCURRENCY posts in flight, so memory
+        use doesn't grow with the size of the threads. `params` caps the
+        posts (`limit`), the replies per post (`max_replies`) and how far
+        back posts are taken (`days`).
+        """
+        params = job.params
+        checkpoint = job.checkpoint
+
+        logger.info(f"Fetching comments from: {params['channel_id']}")
+        with metrics.time("resolve_entity", job):
+            entity = await get_entity_cached(self.entity_cache, client, params['channel_id'], limiter)
+        state_key = params.get('state_key') or f"comments:{utils.get_peer_id(entity)}"
+        since = datetime.utcnow() - timedelta(days=params['days']) if params.get('days') else None
+        
+        # High-water marks of the previous crawl of this channel. In incremental
+        # mode only posts whose reply counter moved past their mark are fetched,
+        # and new commenters are merged into the previous result. The marks of
+        # posts finished so far are checkpointed, so a suspended crawl skips them.
+        if 'marks' not in checkpoint:
+            previous = self.store.get_crawl_state(state_key) if params.get('incremental') else None
+            checkpoint['marks'] = previous["replies"] if previous else {}
+            checkpoint['done'] = []
+        if 'first_seq' not in checkpoint:
+            # Rows from here on are this crawl's, and can be replaced by a better comment
+            checkpoint['first_seq'] = self.store.get(job.id).total_count
+            self.checkpoint(job)
+        # Post ids come back as strings from a saved checkpoint or crawl state
+        marks = checkpoint['marks'] = {int(post_id): mark for post_id, mark in checkpoint['marks'].items()}
+        done = set(checkpoint['done'])
+        
+        # One author lookup per post and comment was an RPC before; count what is left
+        if not job.stats:
+            job.stats = {'lookups': 0, 'rpcs': 0, 'flood_waits': 0}
+        job.stats.setdefault('reply_pages', 0)
+        job.stats.setdefault('capped_posts', 0)
+        # Users already in the result: from an earlier crawl, or from this one
+        # before a suspension, whose stored comment the store compares against
+        kept = dict.fromkeys(self.store.keys(job.id))
+        kept.update(dict.fromkeys(self.store.keys(job.id, after=checkpoint['first_seq'] - 1), (0, 0)))
+        post_ids = []
+        slots = asyncio.Semaphore(COMMENTS_CONCURRENCY)
+        tasks = set()
+        
+        async def crawl_post(message):
+            try:
+                try:
+                    marks[message.id] = await self.crawl_post(
+                        job, client, entity, message, limiter, kept, min_id=marks.get(message.id, 0)
+                    )
+                except CrawlSuspended:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error processing message {message.id}: {str(e)}")
+                    return
+                job.pages_fetched += 1
+                checkpoint['done'].append(message.id)
+                with metrics.time("checkpoint", job):
+                    self.checkpoint(job)
+            finally:
+                slots.release()
+        
+        def check(tasks):
+            # A suspended post suspends the whole crawl
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception():
+                    raise task.exception()
+        
+        try:
+            job.total_expected = len(done)
+            async for message in self.iter_posts(job, client, entity, limiter, params['limit'], since):
+                post_ids.append(message.id)
+                # Posts without new replies keep their mark and cost no request
+                if message.id in done or not has_new_replies(message, marks.get(message.id, 0)):
+                    continue
+                job.total_expected += 1
+                await slots.acquire()
+                check(tasks)
+                tasks = {task for task in tasks if not task.done()}
+                tasks.add(asyncio.create_task(crawl_post(message)))
+            if tasks:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                check(tasks)
+        finally:
+            # Don't leave post fetches running if the crawl was aborted or suspended
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            job.stats['flood_waits'] += limiter.flood_waits
+        
+        self.store.save_crawl_state(
+            state_key, job.id,
+            {"replies": {post_id: marks.get(post_id, 0) for post_id in post_ids}}
+        )
+        
+        stats = job.stats
+        rpcs_saved = stats['lookups'] - stats['rpcs']
+        self.store.update_meta(
+            job.id,
+            chat={"id": utils.get_peer_id(entity), "title": getattr(entity, 'title', None)},
+            rpcs_saved=rpcs_saved,
+            new_commenters=job.users_kept,
+            refreshed_at=datetime.now().isoformat()
+        )
+        logger.info(f"Successfully processed {len(kept)} unique users")
+        logger.info(f"New commenters added to result {job.id}: {job.users_kept}")
+        logger.info(f"Author lookups: {stats['lookups']}, RPCs made: {stats['rpcs']}, RPCs saved: {rpcs_saved}")
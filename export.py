@@ -0,0 +1,107 @@
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple
+import csv
+import io
+import json
+
+from records import format_username
+
+# Rows are written out in chunks so a download never holds more than one
+# chunk of serialized output in memory, whatever the size of the result.
+CHUNK_SIZE = 1000
+
+Column = Tuple[str, Callable[[object], object]]
+
+# Member rows are `records.Member` objects
+USER_COLUMNS: List[Column] = [
+    ('Username', lambda user: user.username or ''),
+    ('First Name', lambda user: user.first_name or ''),
+    ('Last Name', lambda user: user.last_name or ''),
+    ('Premium', lambda user: 'Yes' if user.premium else 'No'),
+    ('Phone', lambda user: user.phone or ''),
+    ('Last Seen', lambda user: user.last_seen_text or ''),
+    ('User ID', lambda user: user.id),
+]
+
+# Rows of merged (batch) results are `records.SourcedMember` objects
+SOURCED_USER_COLUMNS: List[Column] = USER_COLUMNS + [
+    ('Sources', lambda user: ', '.join(user.sources)),
+]
+
+# Parquet column types of the NDJSON fields, as pyarrow type names
+MEMBER_FIELDS = [
+    ('id', 'int64'), ('username', 'string'), ('first_name', 'string'), ('last_name', 'string'),
+    ('premium', 'bool'), ('phone', 'string'), ('last_seen', 'string'), ('last_seen_timestamp', 'int64'),
+]
+COMMENT_FIELDS = [
+    ('post_author', 'string'), ('post_date', 'string'), ('post_text', 'string'), ('comment_id', 'int64'),
+    ('user_id', 'int64'), ('username', 'string'), ('first_name', 'string'), ('last_name', 'string'),
+    ('text', 'string'), ('date', 'string'), ('reply_to', 'int64'), ('is_premium', 'bool'),
+]
+
+# Rows of membership diffs are dicts: a member's `to_dict()` with the
+# `change`, and for changed members the old and new value of each field
+DIFF_COLUMNS: List[Column] = [
+    ('Change', lambda row: row['change']),
+    ('Username', lambda row: row['username'] or ''),
+    ('First Name', lambda row: row['first_name'] or ''),
+    ('Last Name', lambda row: row['last_name'] or ''),
+    ('Premium', lambda row: 'Yes' if row['premium'] else 'No'),
+    ('Phone', lambda row: row['phone'] or ''),
+    ('Last Seen', lambda row: row['last_seen'] or ''),
+    ('User ID', lambda row: row['id']),
+    ('Changes', lambda row: '; '.join(
+        f"{field}: {values['old']} -> {values['new']}" for field, values in row.get('changes', {}).items()
+    )),
+]
+
+COMMENT_COLUMNS: List[Column] = [
+    ('Username', lambda comment: format_username(comment.get('username'))),
+    ('Name', lambda comment: f"{comment.get('first_name') or ''} {comment.get('last_name') or ''}".strip()),
+    ('Premium', lambda comment: 'Yes' if comment.get('is_premium') else 'No'),
+    ('Phone', lambda comment: '-'),
+    ('Last Seen', lambda comment: '-'),
+    ('User ID', lambda comment: comment.get('user_id', '')),
+]
+
+
+def iter_csv(chunks: Iterable[Sequence], columns: List[Column]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    writer.writerow([name for name, _ in columns])
+    for chunk in chunks:
+        for row in chunk:
+            writer.writerow([value(row) for _, value in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail
+
+
+def iter_ndjson(chunks: Iterable[Sequence]) -> Iterator[str]:
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(row.to_dict() if hasattr(row, 'to_dict') else row, ensure_ascii=False, default=str) + "\n"
+            for row in chunk
+        )
+
+
+def write_parquet(path: str, chunks: Iterable[Sequence], fields: List[Tuple[str, str]]) -> int:
+    """Write rows to a Parquet file, one row group per chunk. Needs pyarrow.
+
+    Returns the number of rows written.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in fields])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            rows = [row.to_dict() if hasattr(row, 'to_dict') else row for row in chunk]
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            count += len(rows)
+    return count
@@ -0,0 +1,130 @@
+from bisect import bisect_left
+from itertools import compress
+from operator import itemgetter
+from typing import List, Optional
+import time
+
+from records import Member
+
+SORT_KEYS = ('username', 'name', 'last_seen', 'id')
+
+FEMALE_LAST_NAME_ENDINGS = ('ova', 'eva', 'ina', 'aya', 'ska', 'cka', 'ová', 'ова', 'ева', 'ина', 'ая', 'ська', 'цька')
+MALE_LAST_NAME_ENDINGS = ('ov', 'ev', 'in', 'sky', 'ski', 'cki', 'ов', 'ев', 'ин', 'ий', 'ський', 'цький')
+MALE_NAMES_ENDING_IN_A = {
+    'nikita', 'ilya', 'sasha', 'misha', 'kolya', 'vanya', 'petya', 'danila', 'foma', 'luca', 'joshua', 'andrea',
+    'никита', 'илья', 'саша', 'миша', 'коля', 'ваня', 'петя', 'данила', 'фома', 'ілля', 'микола',
+}
+
+
+def guess_gender(first_name: Optional[str], last_name: Optional[str]) -> Optional[str]:
+    """Best-effort guess from name endings; Telegram does not expose gender.
+
+    Returns 'male', 'female' or None when the names give no clear hint.
+    """
+    last = (last_name or '').strip().lower()
+    if last.endswith(FEMALE_LAST_NAME_ENDINGS):
+        return 'female'
+    if last.endswith(MALE_LAST_NAME_ENDINGS):
+        return 'male'
+    first = (first_name or '').strip().lower().split(' ')[0]
+    if not first or not first.isalpha():
+        return None
+    if first in MALE_NAMES_ENDING_IN_A:
+        return 'male'
+    if first.endswith(('a', 'ia', 'ya', 'а', 'я')):
+        return 'female'
+    return 'male' if first[-1] in 'bcdfghjklmnprstvzбвгджзклмнпрстфхцчшщй' else None
+
+
+class MemberIndex:
+    """Filter and sort indexes over every member of one stored result.
+
+    Boolean attributes are kept as byte masks (one byte per member, packed
+    into a Python int) so combining filters is a single C-level AND. Last
+    seen times and usernames are kept sorted for range and prefix lookups.
+    """
+
+    def __init__(self, members: List[Member]):
+        self.members = members
+        self.size = len(members)
+        self.all = self._mask(range(self.size))
+        self.premium = self._mask(i for i, m in enumerate(members) if m.premium)
+        self.phone = self._mask(i for i, m in enumerate(members) if m.phone)
+        genders = [guess_gender(m.first_name, m.last_name) for m in members]
+        self.gender = {
+            'male': self._mask(i for i, g in enumerate(genders) if g == 'male'),
+            'female': self._mask(i for i, g in enumerate(genders) if g == 'female'),
+        }
+        # Members that were never seen online (hidden status) sort first
+        self.by_last_seen = sorted(range(self.size), key=lambda i: members[i].last_seen or 0)
+        self.last_seen_values = [members[i].last_seen or 0 for i in self.by_last_seen]
+        named = sorted((m.username.lower(), i) for i, m in enumerate(members) if m.username)
+        self.usernames = [name for name, _ in named]
+        self.username_positions = [i for _, i in named]
+        self._orders = {}
+        self._last_seen_masks = {}
+
+    def _mask(self, positions) -> int:
+        flags = bytearray(self.size)
+        for i in positions:
+            flags[i] = 1
+        return int.from_bytes(flags, 'little')
+
+    def _flags(self, mask: int) -> bytes:
+        return mask.to_bytes(self.size, 'little')
+
+    def seen_within(self, hours: int) -> int:
+        """Members seen within `hours`; members with a hidden status are kept, as at crawl time."""
+        bucket = (hours, int(time.time() // 60))
+        if bucket not in self._last_seen_masks:
+            cutoff = time.time() - hours * 3600
+            start = bisect_left(self.last_seen_values, cutoff)
+            hidden = bisect_left(self.last_seen_values, 1)
+            if len(self._last_seen_masks) > 16:
+                self._last_seen_masks.clear()
+            self._last_seen_masks[bucket] = self._mask(self.by_last_seen[:hidden] + self.by_last_seen[start:])
+        return self._last_seen_masks[bucket]
+
+    def username_prefix(self, prefix: str) -> int:
+        prefix = prefix.lower().lstrip('@')
+        start = bisect_left(self.usernames, prefix)
+        end = bisect_left(self.usernames, prefix + '\U0010ffff')
+        return self._mask(self.username_positions[start:end])
+
+    def order(self, sort: Optional[str]) -> List[int]:
+        if sort not in SORT_KEYS:
+            return list(range(self.size))
+        if sort not in self._orders:
+            members = self.members
+            if sort == 'last_seen':
+                order = self.by_last_seen[::-1]
+            elif sort == 'username':
+                order = sorted(range(self.size), key=lambda i: (members[i].username is None, (members[i].username or '').lower()))
+            elif sort == 'name':
+                order = sorted(range(self.size), key=lambda i: f"{members[i].first_name or ''} {members[i].last_name or ''}".lower())
+            else:
+                order = sorted(range(self.size), key=lambda i: members[i].id)
+            self._orders[sort] = order
+        return self._orders[sort]
+
+    def query(self, premium_only=False, with_phone=False, last_seen=None, gender=None, q=None, sort=None) -> List[int]:
+        """Positions of the members matching the filters, in `sort` order."""
+        mask = self.all
+        if premium_only:
+            mask &= self.premium
+        if with_phone:
+            mask &= self.phone
+        if last_seen:
+            mask &= self.seen_within(last_seen)
+        if gender in self.gender:
+            mask &= self.gender[gender]
+        if q:
+            mask &= self.username_prefix(q)
+        order = self.order(sort)
+        if not order:
+            return []
+        flags = self._flags(mask)
+        if sort not in SORT_KEYS:
+            return list(compress(order, flags))
+        picked = itemgetter(*order)(flags) if len(order) > 1 else (flags[order[0]],)
+        return list(compress(order, picked))
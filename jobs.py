@@ -0,0 +1,161 @@
+from pydantic import BaseModel
+from typing import Any, Awaitable, Callable, Dict, Optional
+from ratelimit import CrawlSuspended
+import asyncio
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    params: Dict[str, Any] = {}
+    status: str = "queued"  # queued -> running (<-> suspended) -> done | failed
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    pages_fetched: int = 0
+    users_seen: int = 0
+    users_kept: int = 0
+    total_expected: Optional[int] = None
+    stats: Dict[str, Any] = {}
+    # Seconds spent per crawl stage (see metrics.Metrics.time)
+    timings: Dict[str, float] = {}
+    # Where the crawl got to; a resumed job continues from here
+    checkpoint: Dict[str, Any] = {}
+    resume_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def eta_seconds(self) -> Optional[float]:
+        """Estimate the remaining crawl time from the rate observed so far."""
+        if self.status != "running" or not self.started_at:
+            return None
+        if not self.total_expected or not self.users_seen:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = max(self.total_expected - self.users_seen, 0)
+        return round(elapsed / self.users_seen * remaining, 1)
+
+    def status_dict(self) -> dict:
+        data = self.model_dump(exclude={"params", "checkpoint"})
+        data["eta_seconds"] = self.eta_seconds()
+        return data
+
+
+JobHandler = Callable[[Job], Awaitable[None]]
+
+
+class JobManager:
+    """Runs crawl jobs on a bounded pool of asyncio worker tasks.
+
+    Handlers are registered per job kind and receive the `Job` they run, which
+    they update in place so status endpoints can report progress while the
+    crawl is still going. A handler that raises `CrawlSuspended` is put back
+    on the queue once the wait is over and is expected to continue from
+    `job.checkpoint`. `on_status` is called on every status change, so jobs
+    can be persisted and `restore`d by another process or after a restart.
+    """
+
+    def __init__(self, workers: int = 2, on_status: Optional[Callable[[Job], None]] = None):
+        self.workers = max(1, workers)
+        self.on_status = on_status
+        self.jobs: Dict[str, Job] = {}
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, kind: str, params: dict, job_id: Optional[str] = None) -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job manager is not running")
+        job = Job(id=job_id or uuid.uuid4().hex, kind=kind, params=params, created_at=time.time())
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._notify(job)
+        return job
+
+    def restore(self, job: Job):
+        """Queue a job loaded from storage; it continues from its checkpoint."""
+        if job.kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        self.jobs[job.id] = job
+        job.error = None
+        job.finished_at = None
+        delay = (job.resume_at or 0) - time.time()
+        if delay > 0:
+            job.status = "suspended"
+            asyncio.get_running_loop().call_later(delay, self._resume, job)
+            self._notify(job)
+        else:
+            self._resume(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _resume(self, job: Job):
+        job.status = "queued"
+        job.resume_at = None
+        self._queue.put_nowait(job)
+        self._notify(job)
+
+    def _notify(self, job: Job):
+        if self.on_status:
+            try:
+                self.on_status(job)
+            except Exception as e:
+                logger.error(f"Error saving status of {job.kind} job {job.id}: {str(e)}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = job.started_at or time.time()
+            self._notify(job)
+            try:
+                await self._handlers[job.kind](job)
+                job.status = "done"
+            except CrawlSuspended as e:
+                logger.warning(f"{job.kind} job {job.id} suspended for {int(e.seconds)}s")
+                job.status = "suspended"
+                job.resume_at = time.time() + e.seconds
+                asyncio.get_running_loop().call_later(e.seconds, self._resume, job)
+            except asyncio.CancelledError:
+                # Shutting down; the job is picked up again from its checkpoint
+                job.status = "queued"
+                raise
+            except Exception as e:
+                logger.exception(f"Error in {job.kind} job {job.id}: {str(e)}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                if job.finished:
+                    job.finished_at = time.time()
+                self._queue.task_done()
+                self._notify(job)
@@ -1,122 +1,292 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request, Form, Query
+from fastapi import FastAPI, HTTPException, Depends, Request, Form, Query
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
-from telethon import TelegramClient, functions, types
-from telethon.tl.functions.channels import GetParticipantsRequest
-from telethon.tl.types import ChannelParticipantsSearch
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from telethon import TelegramClient, utils
+from typing import Optional
 import os
 import asyncio
+import time
 from math import ceil
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+from bisect import bisect_right
+from jobs import Job, JobManager
+from export import CHUNK_SIZE, COMMENT_COLUMNS, DIFF_COLUMNS, SOURCED_USER_COLUMNS, USER_COLUMNS, iter_csv, iter_ndjson
+from storage import open_store
+from ratelimit import CrawlSuspended, RateLimiter
+from cache import TTLCache, get_entity_cached, normalize_key
+from records import Member, SourcedMember, format_username
+from filters import SORT_KEYS, MemberIndex
+from urllib.parse import urlencode
+from clients import ClientPool, start_bot_client, start_user_client
+from crawler import Crawler
+from monitor import CommentMonitor
+from glob import glob
+from logging.handlers import QueueHandler, QueueListener
+from metrics import metrics
+import json
+import logging
+import queue
+import uuid
+
+# Log records are written to stderr by a background thread, so logging
+# never blocks the event loop on a slow terminal or pipe
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[QueueHandler(log_queue)]
+)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Parser Pro Web")
 
 # Mount static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
+# Templates are compiled once and not checked for changes on every render;
+# set TEMPLATES_AUTO_RELOAD=1 while editing them
+templates.env.auto_reload = os.getenv('TEMPLATES_AUTO_RELOAD') == '1'
+templates.env.filters['username'] = format_username
 
-# Telegram API credentials
-API_ID = 24051818
-API_HASH = "a86f5da90e15c17c78e388003925b3a4"
 BOT_TOKEN = os.getenv('BOT_TOKEN')  # You'll need to set this in .env
 
 if not BOT_TOKEN:
     raise ValueError("Please set BOT_TOKEN in .env file. Get it from @BotFather on Telegram.")
 
+# Several comma-separated bot tokens, and several user sessions in SESSIONS_DIR
+# (created with `python auth.py sessions/<name>`), spread crawls over accounts
+BOT_TOKENS = [token.strip() for token in BOT_TOKEN.split(',') if token.strip()]
+SESSIONS_DIR = os.getenv('SESSIONS_DIR', 'sessions')
+CLIENT_POOL_STRATEGY = os.getenv('CLIENT_POOL_STRATEGY', 'least_loaded')
+CLIENT_HEALTH_SECONDS = float(os.getenv('CLIENT_HEALTH_SECONDS', '60'))
+
 # OAuth2 scheme for user authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-class ParsingResult(BaseModel):
-    users: List[dict]
-    total_count: int
+# Client pools, started in the background at startup (or by the first request
+# that needs them, if it comes earlier) and kept connected by client_health
+bot_pool = ClientPool("bot", CLIENT_POOL_STRATEGY)
+user_pool = ClientPool("user", CLIENT_POOL_STRATEGY)
+
+# Results are kept in a store shared by all worker processes
+result_store = open_store(
+    os.getenv('RESULT_STORE_PATH', 'results.db'),
+    ttl_hours=float(os.getenv('RESULT_TTL_HOURS', '168')),
+    max_rows=int(os.getenv('RESULT_MAX_ROWS', '5000000'))
+)
+
+# Crawl jobs are saved with their checkpoint next to their result. Jobs whose
+# process stopped refreshing them for 3 heartbeats are resumed by another one
+# (or by this one after a restart).
+JOB_OWNER = uuid.uuid4().hex
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '30'))
+
+# Running batch jobs, by id. Their targets are crawled as child jobs that
+# are saved inside the batch's checkpoint rather than on their own.
+batch_jobs = {}
+
+def checkpoint_job(job):
+    batch = batch_jobs.get(job.params.get('result_id'))
+    if batch is not None:
+        batch.checkpoint['targets'][job.params['source']] = job.model_dump(exclude={'id', 'kind', 'params'})
+        update_batch_progress(batch)
+        job = batch
+    result_store.save_job(job.id, job.kind, job.status, JOB_OWNER, job.model_dump())
+
+def save_job_status(job):
+    result_store.update_meta(job.id, status=job.status, error=job.error, resume_at=job.resume_at)
+    checkpoint_job(job)
+
+# Every Telegram call made by the crawlers goes through one limiter, which
+# learns a safe rate per session and method. FloodWaits longer than
+# MAX_INLINE_FLOOD_WAIT seconds suspend the job until the wait is over.
+rate_limiter = RateLimiter(
+    rate=float(os.getenv('TELEGRAM_RATE', '10')),
+    max_rate=float(os.getenv('TELEGRAM_MAX_RATE', '30')),
+    max_inline_wait=float(os.getenv('MAX_INLINE_FLOOD_WAIT', '60')),
+    max_retries=int(os.getenv('TELEGRAM_MAX_RETRIES', '5'))
+)
+
+# Resolved chats, channels and users, shared by all requests
+entity_cache = TTLCache(
+    maxsize=int(os.getenv('ENTITY_CACHE_SIZE', '50000')),
+    ttl=float(os.getenv('ENTITY_CACHE_TTL', '3600'))
+)
+
+# Filter/sort indexes of recently viewed member results
+member_indexes = TTLCache(maxsize=int(os.getenv('MEMBER_INDEX_CACHE_SIZE', '8')), ttl=600)
+# Matching positions of recent filter queries, so paging through a view
+# doesn't re-run the query; short-lived as "last seen" filters move with time
+member_queries = TTLCache(maxsize=32, ttl=60)
+
+# Member and comment crawls, shared with the command line (crawl.py)
+crawler = Crawler(result_store, entity_cache, checkpoint_job)
+
+# Upper bounds on the posts of one comments crawl and the replies read per
+# post (0: no limit on replies)
+COMMENTS_MAX_POSTS = int(os.getenv('COMMENTS_MAX_POSTS', '1000'))
+COMMENTS_MAX_REPLIES = int(os.getenv('COMMENTS_MAX_REPLIES', '0'))
+COMMENT_SEARCH_LIMIT = 50
+
+# Live comment monitoring, and how long a /live stream waits for new rows
+# before checking the store anyway (rows added by crawls or other workers)
+comment_monitor = CommentMonitor(result_store, max_posts=int(os.getenv('MONITOR_MAX_POSTS', '1000')))
+LIVE_POLL_SECONDS = float(os.getenv('LIVE_POLL_SECONDS', '15'))
+
+# Largest page returned by the /rows endpoints
+ROWS_LIMIT_MAX = 1000
+
+# Member fields a diff between two crawls can compare, and the ones it
+# compares by default. Diffs of finished crawls don't change, so they are
+# kept for a while for paging and export.
+DIFF_FIELDS = ("username", "first_name", "last_name", "premium", "phone", "last_seen")
+DIFF_DEFAULT_FIELDS = "username,premium,last_seen"
+member_diffs = TTLCache(maxsize=8, ttl=600)
+
+# Batches crawl up to BATCH_CONCURRENCY of their chats at a time, and no
+# more than BATCH_GLOBAL_CONCURRENCY chats are crawled across all batches
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_MAX_TARGETS = int(os.getenv('BATCH_MAX_TARGETS', '1000'))
+batch_slots = asyncio.Semaphore(int(os.getenv('BATCH_GLOBAL_CONCURRENCY', '8')))
+
+# Long-running crawls are run by a bounded pool of background workers
+job_manager = JobManager(workers=int(os.getenv('PARSE_WORKERS', '2')), on_status=save_job_status)
+
+def user_session_files():
+    """The session made by `python auth.py`, plus every session in SESSIONS_DIR."""
+    files = [os.path.join(os.getcwd(), "telegram_session")]
+    files += sorted(path[:-len(".session")] for path in glob(os.path.join(SESSIONS_DIR, "*.session")))
+    return [path for path in files if os.path.exists(path + ".session")]
+
+async def start_bot_pool():
+    starters = {}
+    for i, token in enumerate(BOT_TOKENS):
+        session_name = 'bot_session' if i == 0 else f'bot_session_{i + 1}'
+        starters[session_name] = lambda token=token, session_name=session_name: start_bot_client(token, session_name)
+    return await bot_pool.start(starters)
 
-class CommentResult(BaseModel):
-    comments: List[dict]
-    total_count: int
+async def start_user_pool():
+    starters = {
+        os.path.basename(session_file): lambda session_file=session_file: start_user_client(session_file)
+        for session_file in user_session_files()
+    }
+    return await user_pool.start(starters)
 
-# Create client instances
-bot_client = None
-user_client = None
+async def client_health():
+    """Connect the client pools ahead of the first request, then keep checking their connections."""
+    checked = False
+    while True:
+        for start_pool in (start_bot_pool, start_user_pool):
+            try:
+                pool = await start_pool()
+                if checked:
+                    await pool.check()
+            except Exception as e:
+                logger.error(f"Error in client health check: {str(e)}")
+        checked = True
+        await asyncio.sleep(CLIENT_HEALTH_SECONDS)
+
+async def get_user_client():
+    pool = await start_user_pool()
+    async with pool.lease() as pooled:
+        yield pooled.client if pooled else None
+
+def export_response(result_id, columns, filename, fmt, decode=None, chunks=None):
+    if chunks is None:
+        chunks = result_store.iter_chunks(result_id, CHUNK_SIZE)
+        if decode:
+            chunks = ([decode(row) for row in chunk] for chunk in chunks)
+    if fmt == "csv":
+        body = iter_csv(chunks, columns)
+        media_type = "text/csv"
+    elif fmt == "ndjson":
+        body = iter_ndjson(chunks)
+        media_type = "application/x-ndjson"
+    else:
+        raise HTTPException(status_code=404, detail="Unsupported export format")
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{filename}.{fmt}"'
+    })
 
-# Store results in memory (in production, you'd want to use a proper database)
-parsing_results = {}
-comments_results = {}
+def find_job(job_id):
+    """The job from this process, or as last saved by whichever process runs it."""
+    job = job_manager.get(job_id)
+    if job is None:
+        data = result_store.get_job(job_id)
+        job = Job.model_validate(data) if data else None
+    return job
 
-async def get_bot_client():
-    global bot_client
-    if bot_client is None:
-        bot_client = TelegramClient('bot_session', API_ID, API_HASH)
+def restore_jobs(job_id=None):
+    """Claim saved jobs no process is working on and queue them from their checkpoint."""
+    restored = []
+    for data in result_store.claim_jobs(JOB_OWNER, 3 * JOB_HEARTBEAT_SECONDS, job_id):
+        job = Job.model_validate(data)
         try:
-            await bot_client.start(bot_token=BOT_TOKEN)
-            print("Bot successfully authenticated!")
+            job_manager.restore(job)
         except Exception as e:
-            print(f"Error starting bot: {str(e)}")
-            raise
-    
-    try:
-        yield bot_client
-    except Exception as e:
-        print(f"Error in bot client operation: {str(e)}")
-        raise
+            logger.error(f"Error restoring {job.kind} job {job.id}: {str(e)}")
+            continue
+        logger.info(f"Resuming {job.kind} job {job.id} from its checkpoint")
+        restored.append(job)
+    return restored
 
-async def get_user_client():
-    global user_client
-    if user_client is None:
-        session_file = os.path.join(os.getcwd(), "telegram_session")
-        user_client = TelegramClient(
-            session_file,
-            API_ID,
-            API_HASH,
-            device_model="Samsung Galaxy S20",
-            system_version="Android 12",
-            app_version="8.4.1",
-            lang_code="en",
-            system_lang_code="en"
-        )
+async def job_heartbeat():
+    while True:
         try:
-            await user_client.connect()
-            if not await user_client.is_user_authorized():
-                print("User authentication required!")
-                return None
-            print("User successfully authenticated!")
+            result_store.touch_jobs(JOB_OWNER)
+            restore_jobs()
         except Exception as e:
-            print(f"Error starting user client: {str(e)}")
-            raise
-    return user_client
+            logger.error(f"Error in job heartbeat: {str(e)}")
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
 
-def format_last_seen(timestamp):
-    if not timestamp:
-        return None
-    dt = datetime.fromtimestamp(timestamp)
-    now = datetime.now()
-    diff = now - dt
-    
-    if diff < timedelta(hours=1):
-        return f"{diff.seconds // 60} minutes ago"
-    elif diff < timedelta(days=1):
-        return f"{diff.seconds // 3600} hours ago"
-    else:
-        return dt.strftime("%Y-%m-%d %H:%M")
+background_tasks = []
+
+def render_template(template, context):
+    with metrics.time("render", template=template):
+        return templates.TemplateResponse(template, context)
+
+@app.on_event("startup")
+async def startup_event():
+    log_listener.start()
+    await job_manager.start()
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+    background_tasks.append(asyncio.create_task(job_heartbeat()))
+    background_tasks.append(asyncio.create_task(client_health()))
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    global bot_client, user_client
-    if bot_client:
-        await bot_client.disconnect()
-    if user_client:
-        await user_client.disconnect()
+    for task in background_tasks:
+        task.cancel()
+    await job_manager.stop()
+    await comment_monitor.stop()
+    result_store.release_jobs(JOB_OWNER)
+    log_listener.stop()
+    await bot_pool.stop()
+    await user_pool.stop()
 
 @app.get("/")
 async def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return render_template("index.html", {"request": request})
 
 @app.get("/parse")
 async def parse_form(request: Request):
-    return templates.TemplateResponse("parse.html", {"request": request})
+    return render_template("parse.html", {"request": request})
+
+async def run_parse_job(job):
+    pool = await start_bot_pool()
+    # Batch targets go to the client that resolved them, so it needn't resolve them again
+    async with pool.lease(job.params.get("client")) as pooled:
+        if pooled is None:
+            raise RuntimeError("No bot client available")
+        limiter = rate_limiter.session(pooled.client, pooled.name, on_flood=lambda seconds: pool.block(pooled, seconds))
+        peer = job.params.get("peer_id") if pooled.name == job.params.get("client") else None
+        await crawler.crawl_members(job, pooled.client, limiter, peer)
+
+job_manager.register("parse", run_parse_job)
 
 @app.post("/parse")
 async def parse_chat_submit(
@@ -126,285 +296,906 @@ async def parse_chat_submit(
     with_phone: bool = Form(False),
     last_seen: Optional[int] = Form(None),
     gender: Optional[str] = Form(None),
-    client: TelegramClient = Depends(get_bot_client)  # Use bot client for user parsing
+    exhaustive: bool = Form(False)
 ):
     try:
-        print(f"Starting to parse chat: {chat_id}")
-        # Get chat entity
-        print("Getting chat entity...")
-        entity = await client.get_entity(chat_id)
-        print(f"Found chat: {entity.title if hasattr(entity, 'title') else chat_id}")
+        params = {
+            "chat_id": chat_id,
+            "exhaustive": exhaustive,
+            "premium_only": premium_only,
+            "with_phone": with_phone,
+            "last_seen": last_seen,
+            "gender": gender
+        }
+        # Results are filled in by the job, so the page can show them while it runs
+        result_id = result_store.create("parse", {"params": params, "status": "queued"})
+        job = job_manager.submit("parse", params, job_id=result_id)
         
-        # Initialize parameters for participant search
-        offset = 0
-        limit = 100
-        all_participants = []
-        total_processed = 0
+        logger.info(f"Queued parse job {job.id} for chat: {chat_id}")
+        # Redirect to results page, with the form's filters applied to the view
+        view_filters = member_filter_params(premium_only, with_phone, last_seen, gender)
+        return RedirectResponse(url=f"/results/{job.id}?{urlencode({**view_filters, 'page': 1})}", status_code=303)
         
-        print("Starting to fetch members...")
-        while True:
-            print(f"Fetching members batch (offset: {offset}, limit: {limit})...")
-            participants = await client(GetParticipantsRequest(
-                channel=entity,
-                filter=ChannelParticipantsSearch(''),
-                offset=offset,
-                limit=limit,
-                hash=0
-            ))
-            
-            if not participants.users:
-                break
-            
-            print(f"Processing {len(participants.users)} users...")
-            for user in participants.users:
-                last_seen_timestamp = getattr(user.status, 'was_online', None) if hasattr(user, 'status') else None
-                
-                user_dict = {
-                    'id': user.id,
-                    'username': user.username,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'premium': user.premium,
-                    'phone': user.phone if hasattr(user, 'phone') else None,
-                    'last_seen': format_last_seen(last_seen_timestamp)
-                }
-                
-                # Apply filters
-                if premium_only and not user.premium:
-                    continue
-                if with_phone and not user.phone:
-                    continue
-                if last_seen and last_seen_timestamp:
-                    hours_ago = (datetime.now() - datetime.fromtimestamp(last_seen_timestamp)).total_seconds() / 3600
-                    if hours_ago > last_seen:
-                        continue
-                    
-                all_participants.append(user_dict)
-                total_processed += 1
-            
-            print(f"Total users processed: {total_processed}")
-            offset += len(participants.users)
-            if len(participants.users) < limit:
-                break
-
-        print("Finalizing results...")
-        if not all_participants:
-            return templates.TemplateResponse("parse.html", {
-                "request": request,
-                "error": "No users found matching the specified criteria."
-            })
+    except Exception as e:
+        logger.error(f"Error in parse_chat_submit: {str(e)}")
+        return render_template("parse.html", {
+            "request": request,
+            "error": str(e)
+        })
+
+def update_batch_progress(batch):
+    targets = batch.checkpoint['targets'].values()
+    batch.pages_fetched = sum(target.get('pages_fetched', 0) for target in targets)
+    batch.users_seen = sum(target.get('users_seen', 0) for target in targets)
+    # Targets only count the users that were new to the merged result
+    batch.users_kept = sum(target.get('users_kept', 0) for target in targets)
+    batch.total_expected = sum(target.get('total_expected') or 0 for target in targets) or None
+    batch.stats = {
+        job_status: sum(target['status'] == job_status for target in targets)
+        for job_status in ("queued", "running", "done", "failed", "duplicate")
+    }
+
+def batch_target_job(batch, source):
+    """The crawl of one target of `batch`, continuing from its saved state."""
+    params = {
+        "chat_id": source,
+        "exhaustive": batch.params.get("exhaustive"),
+        "max_users": batch.params.get("max_users"),
+        "result_id": batch.id,
+        "source": source,
+        "peer_id": batch.checkpoint.get('peers', {}).get(source),
+        "client": batch.checkpoint.get('clients', {}).get(source)
+    }
+    state = batch.checkpoint['targets'][source]
+    return Job.model_validate({"created_at": batch.created_at, **state, "id": f"{batch.id}:{source}", "kind": "parse", "params": params})
+
+async def resolve_batch_targets(batch):
+    """Resolve every target once, failing the ones that don't resolve and
+    skipping the ones that are another name for a chat already in the batch.
+
+    Access hashes are per account, so each target is later crawled by the
+    client that resolved it; targets are spread over the pool to match.
+    """
+    targets = batch.checkpoint['targets']
+    peers = batch.checkpoint.setdefault('peers', {})
+    clients = batch.checkpoint.setdefault('clients', {})
+    pool = await start_bot_pool()
+    for source, state in targets.items():
+        if state['status'] != "queued" or source in peers:
+            continue
+        async with pool.lease() as pooled:
+            if pooled is None:
+                raise RuntimeError("No bot client available")
+            limiter = rate_limiter.session(pooled.client, pooled.name, on_flood=lambda seconds: pool.block(pooled, seconds))
+            try:
+                with metrics.time("resolve_entity", batch):
+                    entity = await get_entity_cached(entity_cache, pooled.client, source, limiter)
+            except CrawlSuspended:
+                raise
+            except Exception as e:
+                logger.warning(f"Batch {batch.id}: could not resolve {source}: {str(e)}")
+                state.update(status="failed", error=str(e))
+                continue
+        peer_id = utils.get_peer_id(entity)
+        same = next((other for other, peer in peers.items() if peer == peer_id), None)
+        peers[source] = peer_id
+        clients[source] = pooled.name
+        if same:
+            state.update(status="duplicate", error=f"Same chat as {same}")
+    update_batch_progress(batch)
+    checkpoint_job(batch)
+
+async def run_batch_job(job):
+    batch_jobs[job.id] = job
+    try:
+        await resolve_batch_targets(job)
+        concurrency = asyncio.Semaphore(job.params.get("concurrency") or BATCH_CONCURRENCY)
+        
+        async def run_target(source):
+            async with concurrency, batch_slots:
+                child = batch_target_job(job, source)
+                child.status = "running"
+                child.started_at = child.started_at or time.time()
+                try:
+                    await run_parse_job(child)
+                    child.status = "done"
+                except CrawlSuspended:
+                    raise
+                except Exception as e:
+                    logger.error(f"Batch {job.id}: error parsing {source}: {str(e)}")
+                    child.status = "failed"
+                    child.error = str(e)
+                if child.finished:
+                    child.finished_at = time.time()
+                checkpoint_job(child)
+        
+        # A long FloodWait suspends the whole batch; targets continue from
+        # their own checkpoints when it resumes
+        tasks = [
+            asyncio.create_task(run_target(source))
+            for source, state in job.checkpoint['targets'].items()
+            if state['status'] in ("queued", "running")
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        sources = {
+            source: {"status": state['status'], "error": state.get('error'), "users_seen": state.get('users_seen', 0)}
+            for source, state in job.checkpoint['targets'].items()
+        }
+        result_store.update_meta(job.id, sources=sources, coverage=job.stats)
+        logger.info(f"Batch {job.id} completed: {job.stats}, {job.users_kept} distinct users")
+    finally:
+        batch_jobs.pop(job.id, None)
+
+job_manager.register("batch", run_batch_job)
+
+@app.get("/batch")
+async def batch_form(request: Request):
+    return render_template("batch.html", {"request": request})
+
+@app.post("/batch")
+async def batch_submit(
+    request: Request,
+    targets: str = Form(...),
+    exhaustive: bool = Form(False),
+    concurrency: Optional[int] = Form(None),
+    max_users: Optional[int] = Form(None)
+):
+    try:
+        # One target per line or comma-separated; aliases of the same
+        # username or link are merged here, other aliases once resolved
+        sources = {}
+        for target in targets.replace(',', '\n').splitlines():
+            if target.strip():
+                sources.setdefault(normalize_key(target), target.strip())
+        if not sources:
+            raise ValueError("No chats given")
+        if len(sources) > BATCH_MAX_TARGETS:
+            raise ValueError(f"At most {BATCH_MAX_TARGETS} chats can be parsed in one batch")
         
-        # Store results in memory with a unique ID
-        result_id = len(parsing_results)
-        results = {
-            "users": all_participants,
-            "total_count": len(all_participants)
+        params = {
+            "targets": list(sources.values()),
+            "exhaustive": exhaustive,
+            "concurrency": max(1, min(concurrency, BATCH_CONCURRENCY)) if concurrency else None,
+            "max_users": max_users or None
         }
-        parsing_results[result_id] = ParsingResult(**results)
+        result_id = result_store.create("batch", {"params": params, "status": "queued"})
+        job = job_manager.submit("batch", params, job_id=result_id)
+        job.checkpoint['targets'] = {source: {"status": "queued"} for source in params['targets']}
+        update_batch_progress(job)
+        checkpoint_job(job)
         
-        print(f"Parsing completed. Found {len(all_participants)} matching users.")
-        # Redirect to results page
-        return RedirectResponse(url=f"/results/{result_id}?page=1", status_code=303)
+        logger.info(f"Queued batch job {job.id} for {len(sources)} chats")
+        return RedirectResponse(url=f"/results/{job.id}?page=1", status_code=303)
         
     except Exception as e:
-        print(f"Error in parse_chat_submit: {str(e)}")  # Add debug logging
-        return templates.TemplateResponse("parse.html", {
+        logger.error(f"Error in batch_submit: {str(e)}")
+        return render_template("batch.html", {
             "request": request,
             "error": str(e)
         })
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    # The job may be running in another worker process
+    job = find_job(job_id)
+    if job:
+        return job.status_dict()
+    result = result_store.get(job_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "id": result.id,
+        "kind": result.kind,
+        "status": result.meta.get("status"),
+        "error": result.meta.get("error"),
+        "users_kept": result.total_count
+    }
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    """Continue a failed or interrupted crawl from its last checkpoint."""
+    job = job_manager.get(job_id)
+    if job and not job.finished:
+        return job.status_dict()
+    restored = restore_jobs(job_id)
+    if restored:
+        return restored[0].status_dict()
+    data = result_store.get_job(job_id)
+    if not data:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if data["status"] == "done":
+        raise HTTPException(status_code=409, detail="Job already finished")
+    raise HTTPException(status_code=409, detail="Job is being run by another worker")
+
+USER_KEYS = ("username", "first_name", "last_name", "premium", "phone", "last_seen")
+
+def user_entry(entry):
+    """One result a user was found in, as returned by /users/{id}."""
+    row = entry["row"]
+    meta = entry["meta"]
+    found = {"result_id": entry["result_id"], "kind": entry["kind"], "created_at": entry["created_at"]}
+    if entry["kind"] == "comments":
+        username = row.get("username")
+        found.update(
+            chat=meta.get("channel_id"),
+            url=f"/comments_results/{entry['result_id']}",
+            user={
+                "username": username.lstrip("@") if username and username != "No username" else None,
+                "first_name": row.get("first_name"),
+                "last_name": row.get("last_name"),
+                "premium": bool(row.get("is_premium")),
+                "phone": None,
+                "last_seen": None
+            },
+            comment={key: row.get(key) for key in ("post_date", "post_text", "comment_id", "text", "date")}
+        )
+        if meta.get("all_comments"):
+            found["activity"] = result_store.commenters(entry["result_id"], [row["user_id"]]).get(str(row["user_id"]))
+    else:
+        member = Member.from_row(row)
+        user = member.to_dict()
+        found.update(url=f"/results/{entry['result_id']}", user={key: user[key] for key in USER_KEYS})
+        if entry["kind"] == "batch":
+            found["chats"] = result_store.sources_of(entry["result_id"], [member.id]).get(str(member.id), [])
+        else:
+            found["chat"] = meta.get("params", {}).get("chat_id")
+    return found
+
+@app.get("/users/{user_id}")
+async def user_lookup(user_id: int):
+    """The chats and comment threads a user was found in, across every stored result."""
+    with metrics.time("user_lookup"):
+        found = [user_entry(entry) for entry in result_store.user_results(user_id)]
+    if not found:
+        raise HTTPException(status_code=404, detail="User not found in any result")
+    usernames = []
+    for entry in found:
+        username = entry["user"]["username"]
+        if username and username not in usernames:
+            usernames.append(username)
+    return {"user_id": user_id, "user": found[0]["user"], "usernames": usernames, "results": found}
+
+@app.get("/stats/cache")
+async def cache_stats():
+    return entity_cache.stats()
+
+@app.get("/stats/clients")
+async def client_stats():
+    return {"bot": bot_pool.stats(), "user": user_pool.stats()}
+
+@app.get("/ready")
+async def readiness():
+    """200 once the job workers run and a bot client is connected, 503 until then."""
+    ready = job_manager.running and bot_pool.ready
+    return JSONResponse(
+        {"ready": ready, "bot": bot_pool.stats(), "user": user_pool.stats()},
+        status_code=200 if ready else 503
+    )
+
+@app.get("/stats/limiter")
+async def limiter_stats():
+    return rate_limiter.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Point-in-time values are read when scraped
+    for job_status in ("queued", "running", "suspended", "done", "failed"):
+        metrics.set("jobs", sum(job.status == job_status for job in job_manager.jobs.values()), status=job_status)
+    cache = entity_cache.stats()
+    metrics.set("entity_cache_size", cache["size"])
+    metrics.set("entity_cache_hits", cache["hits"])
+    metrics.set("entity_cache_misses", cache["misses"])
+    for pool in (bot_pool, user_pool):
+        metrics.set("pool_clients", len(pool.clients), pool=pool.name)
+        metrics.set("pool_blocked_clients", sum(pooled.blocked for pooled in pool.clients), pool=pool.name)
+        metrics.set("pool_unhealthy_clients", sum(not pooled.healthy for pooled in pool.clients), pool=pool.name)
+    metrics.set("monitored_results", len(comment_monitor.watches))
+    for name, bucket in rate_limiter.stats()["methods"].items():
+        metrics.set("limiter_rate", bucket["rate"], bucket=name)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def member_filter_params(premium_only=False, with_phone=False, last_seen=None, gender=None, q=None, sort=None):
+    """The member filters that are set, as query parameters."""
+    # Empty when the form's "Any time" is picked
+    if last_seen:
+        try:
+            last_seen = int(last_seen)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="last_seen must be a number of hours")
+    params = {
+        "premium_only": "true" if premium_only else None,
+        "with_phone": "true" if with_phone else None,
+        "last_seen": last_seen or None,
+        "gender": gender or None,
+        "q": q or None,
+        "sort": sort or None
+    }
+    return {key: value for key, value in params.items() if value is not None}
+
+def load_member_index(result):
+    """Build, or reuse, the filter/sort index over every member of a result."""
+    # A running crawl keeps adding members, so the index is rebuilt as it grows
+    key = (result.id, result.total_count)
+    index = member_indexes.get(key)
+    if index is None:
+        with metrics.time("build_index"):
+            members = [
+                Member.from_row(row)
+                for chunk in result_store.iter_chunks(result.id, CHUNK_SIZE)
+                for row in chunk
+            ]
+            index = MemberIndex(members)
+        member_indexes.set(key, index)
+    return index
+
+def query_members(result, filters):
+    """Positions and index of the members of `result` matching `filters`."""
+    index = load_member_index(result)
+    key = (result.id, result.total_count, tuple(sorted(filters.items())))
+    positions = member_queries.get(key)
+    if positions is None:
+        with metrics.time("filter"):
+            positions = index.query(
+                premium_only=bool(filters.get('premium_only')),
+                with_phone=bool(filters.get('with_phone')),
+                last_seen=filters.get('last_seen'),
+                gender=filters.get('gender'),
+                q=filters.get('q'),
+                sort=filters.get('sort')
+            )
+        member_queries.set(key, positions)
+    return index, positions
+
+def member_page(result, filters, limit, after=None, offset=None):
+    """One page of members, starting after the cursor `after` or at `offset`.
+
+    Returns the members, how many members match `filters`, and the cursor
+    of the next page (None on the last one). Cursors are row numbers, or
+    ranks in the sort order for sorted views.
+    """
+    if not filters:
+        if offset is not None:
+            after = offset - 1
+        rows = result_store.rows_after(result.id, after, limit)
+        next_cursor = rows[-1][0] if rows and rows[-1][0] + 1 < result.total_count else None
+        return [Member.from_row(row) for _, row in rows], result.total_count, next_cursor
+    
+    index, positions = query_members(result, filters)
+    ranked = filters.get('sort') in SORT_KEYS
+    if offset is not None:
+        start = offset
+    elif after is None:
+        start = 0
+    else:
+        # Positions are row numbers, ascending unless the view is sorted
+        start = after + 1 if ranked else bisect_right(positions, after)
+    page = positions[start:start + limit]
+    next_cursor = None
+    if page and start + len(page) < len(positions):
+        next_cursor = start + len(page) - 1 if ranked else page[-1]
+    return [index.members[i] for i in page], len(positions), next_cursor
+
+def with_sources(result, members):
+    """Members of a batch result, with the chats each was found in."""
+    if result.kind != "batch":
+        return members
+    sources = result_store.sources_of(result.id, [member.id for member in members])
+    return [SourcedMember.of(member, sources.get(str(member.id), [])) for member in members]
+
+def batch_sources(result, job):
+    """Status of each target of a batch, with the number of users found in it."""
+    if job and job.checkpoint.get('targets'):
+        targets = job.checkpoint['targets']
+    else:
+        targets = result.meta.get('sources', {})
+    counts = result_store.source_counts(result.id)
+    return [
+        {"source": source, "status": state.get('status'), "error": state.get('error'), "users": counts.get(source, 0)}
+        for source, state in targets.items()
+    ]
+
 @app.get("/results/{result_id}")
 async def show_results(
     request: Request,
-    result_id: int,
-    page: int = Query(1, ge=1)
+    result_id: str,
+    page: int = Query(1, ge=1),
+    premium_only: bool = Query(False),
+    with_phone: bool = Query(False),
+    last_seen: Optional[str] = Query(None),
+    gender: Optional[str] = Query(None),
+    q: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None)
 ):
     try:
-        results = parsing_results.get(result_id)
-        if not results:
+        results = result_store.get(result_id)
+        if not results or results.kind not in ("parse", "batch"):
             return RedirectResponse(url="/parse", status_code=303)
+        job = find_job(result_id)
+        filters = member_filter_params(premium_only, with_phone, last_seen, gender, q, sort)
         
         # Calculate pagination
         items_per_page = 100
-        total_items = len(results.users)
+        if filters:
+            total_items = len(query_members(results, filters)[1])
+        else:
+            total_items = results.total_count
         total_pages = max(1, ceil(total_items / items_per_page))
         current_page = min(max(1, page), total_pages)
         
         start_idx = (current_page - 1) * items_per_page
-        end_idx = min(start_idx + items_per_page, total_items)
-        page_users = results.users[start_idx:end_idx]
+        page_users, _, next_cursor = member_page(results, filters, items_per_page, offset=start_idx)
+        page_users = with_sources(results, page_users)
         
-        # Convert ParsingResult to dict for JSON serialization
-        results_dict = {
-            "users": results.users,
-            "total_count": results.total_count
-        }
-        
-        return templates.TemplateResponse("results.html", {
+        return render_template("results.html", {
             "request": request,
-            "results": results_dict,
+            "result_id": result_id,
+            "total_count": results.total_count,
+            "matching_count": total_items,
+            "filters": filters,
+            "filter_query": urlencode(filters),
             "page_users": page_users,
+            "next_cursor": next_cursor,
             "current_page": current_page,
-            "total_pages": total_pages
+            "total_pages": total_pages,
+            "job": job.status_dict() if job else None,
+            "show_sources": results.kind == "batch",
+            "sources": batch_sources(results, job) if results.kind == "batch" else None,
+            "previous": previous_crawl(results) if results.kind == "parse" else None
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in show_results: {str(e)}")  # Add debug logging
-        return templates.TemplateResponse("results.html", {
+        logger.error(f"Error in show_results: {str(e)}")
+        return render_template("results.html", {
             "request": request,
             "error": str(e)
         })
 
+def rows_response(request, template, context, rows, next_cursor, fmt):
+    """Just the rows of a page, as JSON or as table rows to append to the page."""
+    if fmt == "html":
+        response = render_template(template, {"request": request, **context})
+    elif fmt == "json":
+        response = JSONResponse({"rows": rows, "next": next_cursor})
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return response
+
+@app.get("/results/{result_id}/rows")
+async def result_rows(
+    request: Request,
+    result_id: str,
+    after: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=ROWS_LIMIT_MAX),
+    fmt: str = Query("json", alias="format"),
+    premium_only: bool = Query(False),
+    with_phone: bool = Query(False),
+    last_seen: Optional[str] = Query(None),
+    gender: Optional[str] = Query(None),
+    q: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None)
+):
+    results = result_store.get(result_id)
+    if not results or results.kind not in ("parse", "batch"):
+        raise HTTPException(status_code=404, detail="Result not found")
+    filters = member_filter_params(premium_only, with_phone, last_seen, gender, q, sort)
+    members, _, next_cursor = member_page(results, filters, limit, after=after)
+    members = with_sources(results, members)
+    rows = [member.to_dict() for member in members] if fmt == "json" else None
+    context = {"page_users": members, "show_sources": results.kind == "batch"}
+    return rows_response(request, "member_rows.html", context, rows, next_cursor, fmt)
+
+@app.get("/results/{result_id}/export.{fmt}")
+async def export_results(
+    result_id: str,
+    fmt: str,
+    premium_only: bool = Query(False),
+    with_phone: bool = Query(False),
+    last_seen: Optional[str] = Query(None),
+    gender: Optional[str] = Query(None),
+    q: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None)
+):
+    results = result_store.get(result_id)
+    if not results or results.kind not in ("parse", "batch"):
+        raise HTTPException(status_code=404, detail="Result not found")
+    filters = member_filter_params(premium_only, with_phone, last_seen, gender, q, sort)
+    columns = SOURCED_USER_COLUMNS if results.kind == "batch" else USER_COLUMNS
+    if not filters:
+        chunks = (
+            with_sources(results, [Member.from_row(row) for row in chunk])
+            for chunk in result_store.iter_chunks(result_id, CHUNK_SIZE)
+        )
+    else:
+        index, positions = query_members(results, filters)
+        chunks = (
+            with_sources(results, [index.members[i] for i in positions[start:start + CHUNK_SIZE]])
+            for start in range(0, len(positions), CHUNK_SIZE)
+        )
+    return export_response(result_id, columns, "parsed_users", fmt, chunks=chunks)
+
+def previous_crawl(result):
+    """The last finished crawl of the same chat before `result`."""
+    chat = result.meta.get("chat")
+    if not chat:
+        return None
+    earlier = [
+        other for other in result_store.find_results(result.kind, chat["id"])
+        if other.created_at < result.created_at and other.meta.get("status") == "done"
+    ]
+    return earlier[-1] if earlier else None
+
+def diff_results(result_id, against, fields):
+    """The two results to compare and the fields to compare, or an HTTP error."""
+    new = result_store.get(result_id)
+    if not new or new.kind not in ("parse", "batch"):
+        raise HTTPException(status_code=404, detail="Result not found")
+    old = result_store.get(against) if against else previous_crawl(new)
+    if not old or old.kind not in ("parse", "batch"):
+        raise HTTPException(status_code=404, detail="No earlier crawl of this chat to compare with")
+    fields = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in fields if field not in DIFF_FIELDS]
+    if unknown or not fields:
+        raise HTTPException(status_code=400, detail=f"Fields can be: {', '.join(DIFF_FIELDS)}")
+    return old, new, fields
+
+def member_diff(old, new, fields):
+    """Users who joined, left, or changed one of `fields` between two member results."""
+    cache_key = (old.id, old.total_count, new.id, new.total_count, fields)
+    diff = member_diffs.get(cache_key)
+    if diff is None:
+        with metrics.time("diff"):
+            # Members are stored as `Member.to_row` arrays, in slot order
+            columns = {Member.__slots__.index(field): field for field in fields}
+            joined, left, changed = result_store.diff_keys(old.id, new.id, list(columns))
+            names = {differ: [columns[column] for column in differ] for differ in set(changed.values())}
+            changes = {key: names[differ] for key, differ in changed.items()}
+            diff = {"joined": joined, "left": left, "changed": list(changes), "fields": changes}
+        member_diffs.set(cache_key, diff)
+    return diff
+
+def diff_entries(old, new, diff, change, keys):
+    rows = result_store.rows_by_key(old.id if change == "left" else new.id, keys)
+    before = result_store.rows_by_key(old.id, keys) if change == "changed" else {}
+    entries = []
+    for key in keys:
+        member = Member.from_row(rows[key]).to_dict()
+        entry = {"change": change, **member}
+        if change == "changed":
+            was = Member.from_row(before[key]).to_dict()
+            entry["changes"] = {field: {"old": was[field], "new": member[field]} for field in diff["fields"][key]}
+        entries.append(entry)
+    return entries
+
+DIFF_CHANGES = ("joined", "left", "changed")
+
+@app.get("/results/{result_id}/diff")
+async def show_diff(
+    request: Request,
+    result_id: str,
+    against: Optional[str] = Query(None),
+    fields: str = Query(DIFF_DEFAULT_FIELDS)
+):
+    """Members who joined, left or changed since an earlier crawl (by default the previous crawl of the chat)."""
+    old, new, fields = diff_results(result_id, against, fields)
+    diff = member_diff(old, new, fields)
+    return render_template("diff.html", {
+        "request": request,
+        "old": old,
+        "new": new,
+        "fields": fields,
+        "all_fields": DIFF_FIELDS,
+        "counts": {change: len(diff[change]) for change in DIFF_CHANGES},
+        "entries": {change: diff_entries(old, new, diff, change, diff[change][:100]) for change in DIFF_CHANGES},
+        "query": urlencode({"against": old.id, "fields": ",".join(fields)})
+    })
+
+@app.get("/results/{result_id}/diff/rows")
+async def diff_rows(
+    result_id: str,
+    change: str = Query(...),
+    against: Optional[str] = Query(None),
+    fields: str = Query(DIFF_DEFAULT_FIELDS),
+    after: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=ROWS_LIMIT_MAX)
+):
+    """One change (joined, left or changed) of a diff as JSON, paged by position."""
+    if change not in DIFF_CHANGES:
+        raise HTTPException(status_code=400, detail=f"Change can be: {', '.join(DIFF_CHANGES)}")
+    old, new, fields = diff_results(result_id, against, fields)
+    diff = member_diff(old, new, fields)
+    start = 0 if after is None else after + 1
+    keys = diff[change][start:start + limit]
+    next_cursor = start + len(keys) - 1 if start + len(keys) < len(diff[change]) else None
+    return {
+        "old": old.id,
+        "new": new.id,
+        "counts": {name: len(diff[name]) for name in DIFF_CHANGES},
+        "rows": diff_entries(old, new, diff, change, keys),
+        "next": next_cursor
+    }
+
+@app.get("/results/{result_id}/diff.{fmt}")
+async def export_diff(
+    result_id: str,
+    fmt: str,
+    against: Optional[str] = Query(None),
+    fields: str = Query(DIFF_DEFAULT_FIELDS)
+):
+    old, new, fields = diff_results(result_id, against, fields)
+    diff = member_diff(old, new, fields)
+    chunks = (
+        diff_entries(old, new, diff, change, diff[change][start:start + CHUNK_SIZE])
+        for change in DIFF_CHANGES
+        for start in range(0, len(diff[change]), CHUNK_SIZE)
+    )
+    return export_response(new.id, DIFF_COLUMNS, "members_diff", fmt, chunks=chunks)
+
 @app.get("/comments")
 async def comments_form(request: Request):
-    return templates.TemplateResponse("comments.html", {"request": request})
+    return render_template("comments.html", {"request": request})
+
+async def run_comments_job(job):
+    pool = await start_user_pool()
+    async with pool.lease() as pooled:
+        if pooled is None:
+            raise RuntimeError("User authentication required. Please run the script locally first to set up user session.")
+        limiter = rate_limiter.session(pooled.client, pooled.name, on_flood=lambda seconds: pool.block(pooled, seconds))
+        await crawler.crawl_comments(job, pooled.client, limiter)
+
+job_manager.register("comments", run_comments_job)
 
 @app.post("/comments")
 async def parse_comments_submit(
     request: Request,
     channel_id: str = Form(...),
     limit: int = Form(10),
+    incremental: bool = Form(False),
+    max_replies: Optional[int] = Form(None),
+    days: Optional[int] = Form(None),
+    all_comments: bool = Form(False),
     client: TelegramClient = Depends(get_user_client)
 ):
     if client is None:
-        return templates.TemplateResponse("comments.html", {
+        return render_template("comments.html", {
             "request": request,
             "error": "User authentication required. Please run the script locally first to set up user session."
         })
 
     try:
-        print(f"\nFetching comments from: {channel_id}")
-        entity = await client.get_entity(channel_id)
-        
-        # Get channel messages first
-        print(f"Fetching last {limit} posts...")
-        messages = await client.get_messages(entity, limit=min(limit, 100))
-        
-        # Use a dictionary to store unique users by user_id
-        unique_users = {}
-        total_processed = 0
-        
-        for message in messages:
-            try:
-                if not message or not message.id:
-                    continue
-                    
-                print(f"\nProcessing message ID: {message.id}")
-                
-                # Get post author info
-                try:
-                    post_author = await client.get_entity(message.from_id) if message.from_id else None
-                    post_author_username = f"@{post_author.username}" if post_author and post_author.username else "Anonymous"
-                except Exception as e:
-                    post_author_username = "Unknown"
-                    print(f"Error getting post author: {str(e)}")
-                
-                # Get all comments for this message
-                comments = await client.get_messages(
-                    entity,
-                    reply_to=message.id,
-                    limit=100
-                )
-                
-                for comment in comments:
-                    if not comment or not comment.from_id:
-                        continue
-                        
-                    try:
-                        # Get comment author info
-                        author = await client.get_entity(comment.from_id)
-                        
-                        # Only add user if we haven't seen them before
-                        if author.id not in unique_users:
-                            comment_dict = {
-                                'post_author': post_author_username,
-                                'post_date': message.date.strftime("%Y-%m-%d %H:%M:%S"),
-                                'post_text': message.text[:100] + "..." if len(message.text) > 100 else message.text,
-                                'comment_id': comment.id,
-                                'user_id': author.id,
-                                'username': f"@{author.username}" if author.username else "No username",
-                                'first_name': author.first_name,
-                                'last_name': author.last_name if hasattr(author, 'last_name') else None,
-                                'text': comment.text,
-                                'date': comment.date.strftime("%Y-%m-%d %H:%M:%S"),
-                                'reply_to': comment.reply_to_msg_id if hasattr(comment, 'reply_to_msg_id') else None,
-                                'is_premium': author.premium if hasattr(author, 'premium') else False
-                            }
-                            unique_users[author.id] = comment_dict
-                            total_processed += 1
-                            print(f"Processed comment from {comment_dict['username']}")
-                        
-                    except Exception as e:
-                        print(f"Error processing comment {comment.id}: {str(e)}")
-                        continue
-                        
-            except Exception as e:
-                print(f"Error processing message {message.id}: {str(e)}")
-                continue
-        
-        # Convert dictionary values to list
-        all_comments = list(unique_users.values())
-        
-        if not all_comments:
-            return templates.TemplateResponse("comments.html", {
-                "request": request,
-                "error": f"No comments found in the last {limit} posts. Try increasing the number of posts to parse."
+        # The channel is resolved here so an incremental crawl can be merged
+        # into the result of the previous crawl of the same channel
+        limiter = rate_limiter.session(client, on_flood=lambda seconds: user_pool.block_client(client, seconds))
+        entity = await get_entity_cached(entity_cache, client, channel_id, limiter)
+        state_key = f"comments:{utils.get_peer_id(entity)}"
+        previous = result_store.get_crawl_state(state_key) if incremental else None
+        if previous and result_store.get(previous["result_id"]):
+            result_id = previous["result_id"]
+            running = find_job(result_id)
+            if running and not running.finished:
+                return RedirectResponse(url=f"/comments_results/{result_id}?page=1", status_code=303)
+            # Once a result keeps every comment, later crawls keep them too
+            all_comments = all_comments or bool(result_store.get(result_id).meta.get("all_comments"))
+            result_store.update_meta(result_id, status="queued", all_comments=all_comments)
+        else:
+            result_id = result_store.create("comments", {
+                "channel_id": channel_id, "limit": limit, "status": "queued", "all_comments": all_comments
             })
         
-        # Store results in memory with a unique ID
-        result_id = len(comments_results)
-        results = CommentResult(comments=all_comments, total_count=len(all_comments))
-        comments_results[result_id] = results
-        
-        print(f"\nSuccessfully processed {len(all_comments)} unique users from {total_processed} total comments")
+        if COMMENTS_MAX_REPLIES:
+            max_replies = min(max_replies or COMMENTS_MAX_REPLIES, COMMENTS_MAX_REPLIES)
+        params = {
+            "channel_id": channel_id,
+            "limit": max(1, min(limit, COMMENTS_MAX_POSTS)),
+            "max_replies": max_replies,
+            "days": days or None,
+            "incremental": incremental,
+            "all_comments": all_comments,
+            "state_key": state_key
+        }
+        job = job_manager.submit("comments", params, job_id=result_id)
+        logger.info(f"Queued comments job {job.id} for channel: {channel_id}")
         
         # Redirect to results page
-        return RedirectResponse(url=f"/comments_results/{result_id}?page=1", status_code=303)
+        return RedirectResponse(url=f"/comments_results/{job.id}?page=1", status_code=303)
         
     except Exception as e:
-        print(f"Error in parse_comments_submit: {str(e)}")
-        return templates.TemplateResponse("comments.html", {
+        logger.error(f"Error in parse_comments_submit: {str(e)}")
+        return render_template("comments.html", {
             "request": request,
             "error": f"Error: {str(e)}\nPlease make sure the channel ID/username is correct and the channel is accessible."
         })
 
+def comment_page(result, after, limit):
+    rows = result_store.rows_after(result.id, after, limit)
+    next_cursor = rows[-1][0] if rows and rows[-1][0] + 1 < result.total_count else None
+    return [row for _, row in rows], next_cursor
+
+def search_comments(result, q=None, user=None, before=None, limit=COMMENT_SEARCH_LIMIT):
+    """Kept comments of a result matching `q` and written by `user` (an id or @username), last stored first."""
+    author = None
+    if user:
+        user = user.strip()
+        if user.lstrip('-').isdigit():
+            author = result_store.commenters(result.id, [user]).get(str(int(user)))
+        else:
+            author = result_store.find_commenter(result.id, user)
+        if author is None:
+            return {"comments": [], "author": None, "next": None}
+    comments = result_store.search_comments(result.id, q, author["user_id"] if author else None, before, limit)
+    names = result_store.commenters(result.id, list({comment["user_id"] for comment in comments}))
+    for comment in comments:
+        comment["username"] = names.get(str(comment["user_id"]), {}).get("username")
+        comment["date"] = datetime.fromtimestamp(comment["date"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "comments": comments,
+        "author": author,
+        "next": comments[-1]["seq"] if len(comments) == limit else None
+    }
+
 @app.get("/comments_results/{result_id}")
 async def show_comments_results(
     request: Request,
-    result_id: int,
-    page: int = Query(1, ge=1)
+    result_id: str,
+    page: int = Query(1, ge=1),
+    q: Optional[str] = Query(None),
+    user: Optional[str] = Query(None),
+    before: Optional[int] = Query(None)
 ):
     try:
-        results = comments_results.get(result_id)
-        if not results:
+        results = result_store.get(result_id)
+        if not results or results.kind != "comments":
             return RedirectResponse(url="/comments", status_code=303)
+        job = find_job(result_id)
         
         # Calculate pagination
         items_per_page = 100
-        total_items = len(results.comments)
+        total_items = results.total_count
         total_pages = max(1, ceil(total_items / items_per_page))
         current_page = min(max(1, page), total_pages)
         
         start_idx = (current_page - 1) * items_per_page
-        end_idx = min(start_idx + items_per_page, total_items)
-        page_comments = results.comments[start_idx:end_idx]
+        page_comments, next_cursor = comment_page(results, start_idx - 1, items_per_page)
+        all_comments = bool(results.meta.get("all_comments"))
+        search = search_comments(results, q, user, before) if all_comments and (q or user) else None
         
-        # Convert user IDs to strings to avoid concatenation issues
-        for comment in page_comments:
-            comment['user_id'] = str(comment['user_id'])
-        
-        return templates.TemplateResponse("comments_results.html", {
+        return render_template("comments_results.html", {
             "request": request,
-            "comments": results.comments,
+            "result_id": result_id,
             "page_comments": page_comments,
+            "next_cursor": next_cursor,
             "current_page": current_page,
             "total_pages": total_pages,
-            "total_count": results.total_count
+            "total_count": results.total_count,
+            "job": job.status_dict() if job else None,
+            "monitoring": result_id in comment_monitor.watches,
+            "all_comments": all_comments,
+            "search": search,
+            "q": q or "",
+            "user": user or ""
         })
         
     except Exception as e:
-        print(f"Error in show_comments_results: {str(e)}")
-        return templates.TemplateResponse("comments_results.html", {
+        logger.error(f"Error in show_comments_results: {str(e)}")
+        return render_template("comments_results.html", {
             "request": request,
             "error": str(e)
-        }) 
\ No newline at end of file
+        }) 
+
+@app.get("/comments_results/{result_id}/export.{fmt}")
+async def export_comments_results(result_id: str, fmt: str):
+    results = result_store.get(result_id)
+    if not results or results.kind != "comments":
+        raise HTTPException(status_code=404, detail="Result not found")
+    return export_response(result_id, COMMENT_COLUMNS, "parsed_comments", fmt)
+
+@app.get("/comments_results/{result_id}/rows")
+async def comments_result_rows(
+    request: Request,
+    result_id: str,
+    after: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=ROWS_LIMIT_MAX),
+    fmt: str = Query("json", alias="format")
+):
+    results = result_store.get(result_id)
+    if not results or results.kind != "comments":
+        raise HTTPException(status_code=404, detail="Result not found")
+    page_comments, next_cursor = comment_page(results, after, limit)
+    return rows_response(request, "comment_rows.html", {"page_comments": page_comments}, page_comments, next_cursor, fmt)
+
+@app.get("/comments_results/{result_id}/search")
+async def comments_search(
+    result_id: str,
+    q: Optional[str] = Query(None),
+    user: Optional[str] = Query(None),
+    before: Optional[int] = Query(None),
+    limit: int = Query(COMMENT_SEARCH_LIMIT, ge=1, le=ROWS_LIMIT_MAX)
+):
+    """Comments matching every word of `q` and/or written by `user`, with the author's aggregates."""
+    results = result_store.get(result_id)
+    if not results or results.kind != "comments":
+        raise HTTPException(status_code=404, detail="Result not found")
+    if not results.meta.get("all_comments"):
+        raise HTTPException(status_code=400, detail="This result only keeps the first comment of each commenter; scan with \"Keep every comment\" to search comments")
+    with metrics.time("search"):
+        return search_comments(results, q, user, before, limit)
+
+@app.get("/comments_results/{result_id}/monitor")
+async def monitor_status(result_id: str):
+    watch = comment_monitor.watches.get(result_id)
+    if watch is None:
+        raise HTTPException(status_code=404, detail="Not monitored")
+    return watch.status_dict()
+
+@app.post("/comments_results/{result_id}/monitor")
+async def start_monitor(result_id: str):
+    """Follow the channel's discussion group and add new commenters as they post.
+
+    The watch lives in this process and ends with it, like the session it leases.
+    """
+    results = result_store.get(result_id)
+    if not results or results.kind != "comments":
+        raise HTTPException(status_code=404, detail="Result not found")
+    if result_id in comment_monitor.watches:
+        return comment_monitor.watches[result_id].status_dict()
+    
+    # The session stays leased for as long as the channel is followed
+    pool = await start_user_pool()
+    pooled = await pool.acquire()
+    if pooled is None:
+        raise HTTPException(status_code=503, detail="User authentication required. Please run the script locally first to set up user session.")
+    try:
+        limiter = rate_limiter.session(pooled.client, pooled.name, on_flood=lambda seconds: pool.block(pooled, seconds))
+        entity = await get_entity_cached(entity_cache, pooled.client, results.meta["channel_id"], limiter)
+        watch = await comment_monitor.watch(result_id, pooled.client, entity, limiter, on_stop=lambda: pool.release(pooled))
+    except Exception as e:
+        pool.release(pooled)
+        logger.error(f"Error starting monitor for {result_id}: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return watch.status_dict()
+
+@app.delete("/comments_results/{result_id}/monitor")
+async def stop_monitor(result_id: str):
+    watch = await comment_monitor.unwatch(result_id)
+    if watch is None:
+        raise HTTPException(status_code=404, detail="Not monitored")
+    return watch.status_dict()
+
+@app.get("/comments_results/{result_id}/live")
+async def comments_live(request: Request, result_id: str, after: Optional[int] = Query(None)):
+    """Server-sent events with the rows added to a comments result from now on.
+
+    Each event carries the new rows and their table rows as HTML; its id is
+    the last row number, so a reconnecting browser continues from there.
+    """
+    results = result_store.get(result_id)
+    if not results or results.kind != "comments":
+        raise HTTPException(status_code=404, detail="Result not found")
+    if after is None:
+        last_event_id = request.headers.get("last-event-id")
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else results.total_count - 1
+    rows_template = templates.get_template("comment_rows.html")
+    
+    async def events():
+        cursor = after
+        while not await request.is_disconnected():
+            rows = result_store.rows_after(result_id, cursor, ROWS_LIMIT_MAX)
+            if rows:
+                cursor = rows[-1][0]
+                page = [row for _, row in rows]
+                data = json.dumps({"rows": page, "html": rows_template.render(page_comments=page)}, default=str)
+                yield f"id: {cursor}\nevent: rows\ndata: {data}\n\n"
+            elif not await comment_monitor.wait(result_id, LIVE_POLL_SECONDS):
+                # Keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Tuple
+import time
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    """Process-wide counters, gauges and latency histograms.
+
+    Cheap enough to update on every RPC: an update is a dict lookup and an
+    add, with no locking (everything runs on the event loop). `render`
+    writes them in the Prometheus text format.
+    """
+
+    def __init__(self, prefix: str = "tgscan"):
+        self.prefix = prefix
+        self.counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self.gauges: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(lambda: defaultdict(Histogram))
+        self.help: Dict[str, str] = {}
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        self.histograms[name][tuple(sorted(labels.items()))].observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str, job=None, **labels):
+        """Time a block as one `stage`, adding it to `job.timings` as well if given.
+
+        Stages of a job can overlap (e.g. concurrent reply fetches), so its
+        timings add up to more than the job's wall time.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("stage_seconds", elapsed, stage=stage, **labels)
+            if job is not None:
+                job.timings[stage] = job.timings.get(stage, 0.0) + elapsed
+
+    def _name(self, name: str) -> str:
+        return f"{self.prefix}_{name}"
+
+    @staticmethod
+    def _labels(labels: Labels, extra: str = "") -> str:
+        parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _header(self, lines, name, kind):
+        if name in self.help:
+            lines.append(f"# HELP {self._name(name)} {self.help[name]}")
+        lines.append(f"# TYPE {self._name(name)} {kind}")
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            self._header(lines, name, "counter")
+            for labels, value in series.items():
+                lines.append(f"{self._name(name)}{self._labels(labels)} {value:g}")
+        for name, series in sorted(self.gauges.items()):
+            self._header(lines, name, "gauge")
+            for labels, value in series.items():
+                lines.append(f"{self._name(name)}{self._labels(labels)} {value:g}")
+        for name, series in sorted(self.histograms.items()):
+            self._header(lines, name, "histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = f'le="{bound:g}"'
+                    lines.append(f"{self._name(name)}_bucket{self._labels(labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self._name(name)}_bucket{self._labels(labels, le)} {histogram.count}")
+                lines.append(f"{self._name(name)}_sum{self._labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{self._name(name)}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+metrics = Metrics()
+metrics.describe("rpc_total", "Telegram calls made, by method and outcome")
+metrics.describe("rpc_seconds", "Latency of Telegram calls, not counting rate limiter waits")
+metrics.describe("flood_waits_total", "FloodWait errors returned by Telegram")
+metrics.describe("flood_wait_seconds_total", "Seconds Telegram asked the crawlers to wait")
+metrics.describe("rate_limit_wait_seconds_total", "Seconds calls were held back by the rate limiter")
+metrics.describe("crawl_suspensions_total", "Crawls suspended until a long FloodWait was over")
+metrics.describe("stage_seconds", "Time spent in each crawl and page rendering stage")
+metrics.describe("monitor_messages_total", "Messages received from followed discussion groups")
+metrics.describe("monitor_commenters_total", "New commenters added to results by live monitoring")
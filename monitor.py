@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from telethon import events, functions, types, utils
+from typing import Callable, Dict, Optional, Set
+import asyncio
+import logging
+import time
+
+from crawler import COMMENT_USER_FIELDS, comment_record, comment_row
+from metrics import metrics
+from storage import ResultStore
+
+logger = logging.getLogger(__name__)
+
+
+class Watch:
+    """One channel whose discussion group is followed for a comments result."""
+
+    def __init__(self, result_id: str, client, channel, group, limiter, on_stop: Optional[Callable[[], None]] = None):
+        self.result_id = result_id
+        self.client = client
+        self.channel = channel
+        self.group = group
+        self.limiter = limiter
+        self.on_stop = on_stop
+        self.started_at = time.time()
+        self.messages = 0
+        self.commenters = 0
+        self.rpcs = 0
+        self.seen_ids: Set[str] = set()
+        # Set for results that keep every comment, not only new commenters
+        self.all_comments = False
+        # Posts of the channel as forwarded to the group, by their id there,
+        # least recently commented first
+        self.posts: OrderedDict[int, object] = OrderedDict()
+        self.handler = None
+
+    def status_dict(self) -> dict:
+        return {
+            "result_id": self.result_id,
+            "channel": getattr(self.channel, "title", None),
+            "group": getattr(self.group, "title", None),
+            "started_at": self.started_at,
+            "messages": self.messages,
+            "commenters": self.commenters,
+            "rpcs": self.rpcs
+        }
+
+
+class CommentMonitor:
+    """Adds new commenters to comment results as they post, from live updates.
+
+    Comments on a channel's posts are messages in its linked discussion
+    group, replying to the post as forwarded there. Telegram pushes those to
+    any session that is a member of the group, so following a thread costs
+    no polling: only the first comment under a post not seen forwarded
+    needs one request, to read the post.
+    """
+
+    def __init__(self, store: ResultStore, max_posts: int = 1000):
+        self.store = store
+        # Posts remembered per watch; older threads cost one request again
+        self.max_posts = max_posts
+        self.watches: Dict[str, Watch] = {}
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+
+    async def watch(self, result_id: str, client, channel, limiter, on_stop=None) -> Watch:
+        if result_id in self.watches:
+            return self.watches[result_id]
+        full = await limiter.call(client, functions.channels.GetFullChannelRequest(channel))
+        linked_id = full.full_chat.linked_chat_id
+        group = next((chat for chat in full.chats if chat.id == linked_id), None) if linked_id else None
+        if group is None:
+            raise ValueError("The channel has no discussion group, so its posts can't be commented on")
+        if getattr(group, "left", False):
+            raise ValueError(f"Join the discussion group \"{group.title}\" with this account to follow its comments")
+
+        watch = Watch(result_id, client, channel, group, limiter, on_stop)
+        watch.seen_ids = set(self.store.keys(result_id))
+        watch.all_comments = bool(self.store.get(result_id).meta.get("all_comments"))
+
+        async def handler(event):
+            try:
+                await self._on_message(watch, event.message)
+            except Exception as e:
+                logger.error(f"Error handling comment {event.message.id} for result {result_id}: {str(e)}")
+
+        watch.handler = handler
+        client.add_event_handler(handler, events.NewMessage(chats=[utils.get_peer_id(group)]))
+        self.watches[result_id] = watch
+        logger.info(f"Following comments of {getattr(channel, 'title', channel)} in \"{group.title}\" for result {result_id}")
+        return watch
+
+    async def _on_message(self, watch: Watch, message):
+        watch.messages += 1
+        metrics.inc("monitor_messages_total")
+        if self._is_post(watch, message):
+            # A new post, forwarded to the group automatically
+            self._remember(watch, message.id, message)
+            return
+        if not message.reply_to or not isinstance(message.from_id, types.PeerUser):
+            return
+        if str(message.from_id.user_id) in watch.seen_ids and not watch.all_comments:
+            return
+
+        post_id = message.reply_to.reply_to_top_id or message.reply_to.reply_to_msg_id
+        if post_id not in watch.posts:
+            post = await watch.limiter.call(watch.client.get_messages, watch.group, ids=post_id)
+            watch.rpcs += 1
+            # Threads under plain group messages are not comments
+            self._remember(watch, post_id, post if post is not None and self._is_post(watch, post) else None)
+        else:
+            watch.posts.move_to_end(post_id)
+        post = watch.posts[post_id]
+        if post is None:
+            return
+        # Senders come with the update, so this is normally not a request
+        author = message.sender
+        if author is None:
+            author = await watch.limiter.call(message.get_sender)
+            watch.rpcs += 1
+        if not isinstance(author, types.User):
+            return
+
+        if watch.all_comments:
+            self.store.add_comments(watch.result_id, [comment_record(post.fwd_from.channel_post, message, author)])
+            if str(author.id) in watch.seen_ids:
+                return
+        # Channel posts have no user author, as in a crawl
+        row = comment_row(post, "Anonymous", message, author, post_id=post.fwd_from.channel_post)
+        watch.seen_ids.add(str(author.id))
+        if self.store.append(watch.result_id, [row], key='user_id', user_fields=COMMENT_USER_FIELDS):
+            watch.commenters += 1
+            metrics.inc("monitor_commenters_total")
+            self._notify(watch.result_id)
+
+    def _remember(self, watch: Watch, post_id: int, post):
+        watch.posts[post_id] = post
+        watch.posts.move_to_end(post_id)
+        while len(watch.posts) > self.max_posts:
+            watch.posts.popitem(last=False)
+
+    @staticmethod
+    def _is_post(watch: Watch, message) -> bool:
+        fwd = message.fwd_from
+        return bool(fwd and fwd.channel_post and fwd.from_id) and utils.get_peer_id(fwd.from_id) == utils.get_peer_id(watch.channel)
+
+    async def unwatch(self, result_id: str) -> Optional[Watch]:
+        watch = self.watches.pop(result_id, None)
+        if watch is None:
+            return None
+        watch.client.remove_event_handler(watch.handler)
+        if watch.on_stop:
+            watch.on_stop()
+        self._notify(result_id)
+        logger.info(f"Stopped following comments for result {result_id}")
+        return watch
+
+    async def stop(self):
+        for result_id in list(self.watches):
+            await self.unwatch(result_id)
+
+    async def wait(self, result_id: str, timeout: float) -> bool:
+        """Wait until rows are added to `result_id` by a watch; False on timeout."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(result_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(result_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[result_id]
+
+    def _notify(self, result_id: str):
+        for waiter in self._waiters.get(result_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {result_id: watch.status_dict() for result_id, watch in self.watches.items()}
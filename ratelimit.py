@@ -0,0 +1,196 @@
+from telethon.errors import FloodWaitError, RpcCallFailError, ServerError, TimedOutError
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import random
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying after a short, jittered backoff
+TRANSIENT_ERRORS = (ServerError, RpcCallFailError, TimedOutError, asyncio.TimeoutError, ConnectionError)
+
+
+class CrawlSuspended(Exception):
+    """Raised when Telegram asks for a wait too long to sit out inside a request.
+
+    Crawl jobs catch it, keep their checkpoint and are rescheduled after
+    `seconds`, instead of failing and losing what was fetched.
+    """
+
+    def __init__(self, seconds: float):
+        super().__init__(f"Rate limited by Telegram, resuming in {int(seconds)}s")
+        self.seconds = seconds
+
+
+class MethodBucket:
+    """Token bucket for one RPC method on one session, with a learned rate.
+
+    The rate grows slowly while calls succeed and is halved on every
+    FloodWait (additive increase, multiplicative decrease), so it settles
+    just under what Telegram tolerates for that method.
+    """
+
+    def __init__(self, rate: float, max_rate: float, min_rate: float = 0.2):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.tokens = max(rate, 1.0)
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.flood_waits = 0
+        self.retries = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            # Burst is capped at one second's worth of calls
+            self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.tokens = 1.0
+                self.updated = time.monotonic()
+            self.tokens -= 1
+            self.calls += 1
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def on_flood(self):
+        self.flood_waits += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 2),
+            "calls": self.calls,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits
+        }
+
+
+class RateLimiter:
+    """Rate limits and retries every Telegram call made by the crawlers.
+
+    Limits are kept per session and RPC method. A FloodWait pauses every
+    call on that session; waits up to `max_inline_wait` seconds are sat out,
+    longer ones raise `CrawlSuspended`.
+    """
+
+    def __init__(self, rate: float = 10.0, max_rate: float = 30.0, max_inline_wait: float = 60, max_retries: int = 5):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.max_inline_wait = max_inline_wait
+        self.max_retries = max_retries
+        self.buckets: Dict[Tuple[int, str], MethodBucket] = {}
+        self._resume_at: Dict[int, float] = {}
+        self._names: Dict[int, str] = {}
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self.suspensions = 0
+
+    def bucket(self, client, method: str) -> MethodBucket:
+        key = (id(client), method)
+        if key not in self.buckets:
+            self.buckets[key] = MethodBucket(self.rate, self.max_rate)
+        return self.buckets[key]
+
+    def session(self, client, name: Optional[str] = None, on_flood=None) -> "SessionLimiter":
+        if name:
+            self._names[id(client)] = name
+        return SessionLimiter(self, client, on_flood)
+
+    async def call(self, client, func, *args, on_flood=None, **kwargs):
+        """Run `func(*args, **kwargs)` against `client` under the limits.
+
+        `func` is either a client method (`client.get_messages`) or the client
+        itself, called with a raw request object.
+        """
+        method = type(args[0]).__name__ if func is client and args else getattr(func, "__name__", "call")
+        bucket = self.bucket(client, method)
+        attempt = 0
+        while True:
+            waited = time.perf_counter()
+            delay = self._resume_at.get(id(client), 0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await bucket.acquire()
+            metrics.inc("rate_limit_wait_seconds_total", time.perf_counter() - waited, method=method)
+            try:
+                result = await self._timed(method, func, *args, **kwargs)
+                bucket.on_success()
+                metrics.inc("rpc_total", method=method, outcome="ok")
+                return result
+            except FloodWaitError as e:
+                bucket.on_flood()
+                self.flood_waits += 1
+                self.flood_wait_seconds += e.seconds
+                metrics.inc("rpc_total", method=method, outcome="flood_wait")
+                metrics.inc("flood_waits_total", method=method)
+                metrics.inc("flood_wait_seconds_total", e.seconds, method=method)
+                if on_flood:
+                    on_flood(e.seconds + 1)
+                if e.seconds > self.max_inline_wait or attempt >= self.max_retries:
+                    self.suspensions += 1
+                    metrics.inc("crawl_suspensions_total")
+                    raise CrawlSuspended(e.seconds + 1)
+                logger.warning(f"FloodWait on {method}: pausing the session for {e.seconds}s")
+                self._resume_at[id(client)] = max(
+                    self._resume_at.get(id(client), 0),
+                    time.monotonic() + e.seconds + random.uniform(0.5, 1.5)
+                )
+            except TRANSIENT_ERRORS as e:
+                metrics.inc("rpc_total", method=method, outcome="error")
+                if attempt >= self.max_retries:
+                    raise
+                bucket.retries += 1
+                wait = min(30, 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Transient error on {method} ({type(e).__name__}), retrying in {wait:.1f}s")
+                await asyncio.sleep(wait)
+            except Exception:
+                metrics.inc("rpc_total", method=method, outcome="error")
+                raise
+            attempt += 1
+
+    @staticmethod
+    async def _timed(method: str, func, *args, **kwargs):
+        """Await the call alone, so its latency leaves out limiter and backoff waits."""
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            metrics.observe("rpc_seconds", time.perf_counter() - started, method=method)
+
+    def stats(self) -> dict:
+        return {
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "suspensions": self.suspensions,
+            "methods": {
+                f"{self._names.get(session, session)}:{method}": bucket.stats()
+                for (session, method), bucket in self.buckets.items()
+            }
+        }
+
+
+class SessionLimiter:
+    """`RateLimiter.call` bound to one client, as handed to a crawl."""
+
+    def __init__(self, limiter: RateLimiter, client, on_flood=None):
+        self.limiter = limiter
+        self.client = client
+        # Called with the wait in seconds, e.g. to take the session out of a pool
+        self.on_flood = on_flood
+        self.flood_waits = 0
+
+    def _flooded(self, seconds: float):
+        self.flood_waits += 1
+        if self.on_flood:
+            self.on_flood(seconds)
+
+    async def call(self, func, *args, **kwargs):
+        return await self.limiter.call(self.client, func, *args, on_flood=self._flooded, **kwargs)
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import sys
+
+
+def format_last_seen(timestamp):
+    if not timestamp:
+        return None
+    dt = datetime.fromtimestamp(timestamp)
+    now = datetime.now()
+    diff = now - dt
+
+    if diff < timedelta(hours=1):
+        return f"{diff.seconds // 60} minutes ago"
+    elif diff < timedelta(days=1):
+        return f"{diff.seconds // 3600} hours ago"
+    else:
+        return dt.strftime("%Y-%m-%d %H:%M")
+
+
+def format_username(username: Optional[str]) -> str:
+    # Comment rows stored before usernames were kept raw hold "@name" or "No username"
+    if not username or username == "No username":
+        return "No username"
+    return "@" + username.lstrip("@")
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # First and last names repeat a lot across big chats
+    return sys.intern(value) if value else value
+
+
+class Member:
+    """One parsed chat member.
+
+    Slotted, with the last-seen time kept as an int timestamp; it is only
+    formatted when a page is rendered or exported. Stored as a JSON array
+    (see `to_row`) rather than an object, so keys aren't repeated per user.
+    """
+
+    __slots__ = ('id', 'username', 'first_name', 'last_name', 'premium', 'phone', 'last_seen')
+
+    # Fields of `to_row` kept once per user in the store's user registry, in
+    # the order of `storage.PROFILE_FIELDS`; the last-seen time changes
+    # between crawls and stays in the row
+    PROFILE_FIELDS = (1, 2, 3, 4, 5)
+
+    def __init__(self, id, username=None, first_name=None, last_name=None, premium=False, phone=None, last_seen=None):
+        self.id = id
+        self.username = username
+        self.first_name = _intern(first_name)
+        self.last_name = _intern(last_name)
+        self.premium = bool(premium)
+        self.phone = phone
+        self.last_seen = last_seen
+
+    @classmethod
+    def from_user(cls, user) -> "Member":
+        was_online = getattr(getattr(user, 'status', None), 'was_online', None)
+        if isinstance(was_online, datetime):
+            was_online = int(was_online.timestamp())
+        return cls(
+            user.id,
+            user.username,
+            user.first_name,
+            user.last_name,
+            user.premium,
+            getattr(user, 'phone', None),
+            was_online
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "Member":
+        if isinstance(row, dict):
+            # Rows written before members were stored as arrays
+            return cls(row['id'], row.get('username'), row.get('first_name'), row.get('last_name'),
+                       row.get('premium'), row.get('phone'))
+        return cls(*row)
+
+    def to_row(self) -> list:
+        return [self.id, self.username, self.first_name, self.last_name, int(self.premium), self.phone, self.last_seen]
+
+    @property
+    def last_seen_text(self) -> Optional[str]:
+        return format_last_seen(self.last_seen)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'username': self.username,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'premium': self.premium,
+            'phone': self.phone,
+            'last_seen': self.last_seen_text,
+            'last_seen_timestamp': self.last_seen
+        }
+
+
+class SourcedMember(Member):
+    """A member of a result merged from several chats, with the chats it was found in."""
+
+    __slots__ = ('sources',)
+
+    @classmethod
+    def of(cls, member: Member, sources) -> "SourcedMember":
+        sourced = cls.__new__(cls)
+        for name in Member.__slots__:
+            setattr(sourced, name, getattr(member, name))
+        sourced.sources = sources
+        return sourced
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), 'sources': self.sources}
@@ -0,0 +1,907 @@
+from abc import ABC, abstractmethod
+from pydantic import BaseModel
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+# The profile of a user as kept in the registry, whatever kind of result it
+# came from: raw Telegram values (no "@" on usernames), premium as a bool
+PROFILE_FIELDS = ("username", "first_name", "last_name", "premium", "phone")
+
+
+class StoredResult(BaseModel):
+    id: str
+    kind: str
+    created_at: float
+    updated_at: float
+    total_count: int
+    meta: Dict[str, Any] = {}
+
+
+class ResultStore(ABC):
+    """Interface for result backends.
+
+    A result is an append-only, ordered list of JSON rows plus a small metadata
+    dict. Rows may carry a `key` (a field name, or an index for array rows,
+    e.g. the user id); a row whose key is already present in the result is
+    skipped, so callers can append overlapping batches.
+
+    Rows can keep the profile of a user (`PROFILE_FIELDS`) in a user
+    registry shared by all results: each distinct profile of a user is kept
+    once, however many results it appears in, and the rows refer to it.
+    Rows are keyed by user id, so finding a user in every result is one
+    index probe per result.
+
+    Results merged from several sources (e.g. the chats of a batch) record
+    which sources each row key was found in.
+
+    Comment results can also keep every comment, not just one row per
+    commenter, with per-commenter aggregates and a full-text index.
+
+    The crawl job filling a result is saved alongside it with its checkpoint.
+    Each unfinished job is owned by one process, which refreshes it while
+    alive; jobs not refreshed for a while can be claimed by another process.
+    """
+
+    @abstractmethod
+    def create(self, kind: str, meta: Optional[dict] = None, result_id: Optional[str] = None) -> str:
+        ...
+
+    @abstractmethod
+    def get(self, result_id: str) -> Optional[StoredResult]:
+        ...
+
+    @abstractmethod
+    def update_meta(self, result_id: str, **fields):
+        ...
+
+    @abstractmethod
+    def append(self, result_id: str, rows: Iterable, key=None, user_fields: Optional[Sequence] = None) -> int:
+        ...
+
+    @abstractmethod
+    def page(self, result_id: str, offset: int, limit: int) -> List:
+        ...
+
+    @abstractmethod
+    def rows_after(self, result_id: str, after: Optional[int], limit: int) -> List[Tuple[int, Any]]:
+        ...
+
+    @abstractmethod
+    def iter_chunks(self, result_id: str, chunk_size: int) -> Iterator[List]:
+        ...
+
+    @abstractmethod
+    def keys(self, result_id: str, after: Optional[int] = None) -> List[str]:
+        ...
+
+    @abstractmethod
+    def merge(self, result_id: str, rows: Iterable, key, rank: Sequence, since: Optional[int],
+              user_fields: Optional[Sequence] = None) -> int:
+        ...
+
+    @abstractmethod
+    def rows_by_key(self, result_id: str, keys: List[str]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def diff_keys(self, old_id: str, new_id: str, fields: Sequence) -> Tuple[List[str], List[str], Dict[str, Tuple]]:
+        ...
+
+    @abstractmethod
+    def find_results(self, kind: str, chat_id: int) -> List[StoredResult]:
+        ...
+
+    @abstractmethod
+    def user_results(self, user_id: int) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def add_sources(self, result_id: str, source: str, keys: Iterable[str]):
+        ...
+
+    @abstractmethod
+    def sources_of(self, result_id: str, keys: List[str]) -> Dict[str, List[str]]:
+        ...
+
+    @abstractmethod
+    def source_keys(self, result_id: str, source: str) -> List[str]:
+        ...
+
+    @abstractmethod
+    def source_counts(self, result_id: str) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def add_comments(self, result_id: str, comments: Iterable[dict]) -> int:
+        ...
+
+    @abstractmethod
+    def search_comments(self, result_id: str, text: Optional[str] = None, user_id: Optional[int] = None,
+                        before: Optional[int] = None, limit: int = 50) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def commenters(self, result_id: str, user_ids: List) -> Dict[str, dict]:
+        ...
+
+    @abstractmethod
+    def find_commenter(self, result_id: str, username: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def get_crawl_state(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def save_crawl_state(self, key: str, result_id: str, state: dict):
+        ...
+
+    @abstractmethod
+    def save_job(self, job_id: str, kind: str, status: str, owner: str, data: dict):
+        ...
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def touch_jobs(self, owner: str):
+        ...
+
+    @abstractmethod
+    def release_jobs(self, owner: str):
+        ...
+
+    @abstractmethod
+    def claim_jobs(self, owner: str, stale_after: float, job_id: Optional[str] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def delete(self, result_id: str):
+        ...
+
+    @abstractmethod
+    def evict(self):
+        ...
+
+
+class SQLiteResultStore(ResultStore):
+    """SQLite-backed store shared by every worker process that opens the same file.
+
+    Rows are numbered densely per result (`seq`), so pages and export chunks
+    are primary-key range reads rather than scans. Results older than `ttl`
+    seconds are dropped, then the oldest results are dropped until the store
+    holds at most `max_rows` rows.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_rows: Optional[int] = None):
+        self.path = path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                total_count INTEGER NOT NULL DEFAULT 0,
+                meta TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS results_updated ON results(updated_at);
+            CREATE TABLE IF NOT EXISTS result_rows (
+                result_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                key TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (result_id, seq)
+            ) WITHOUT ROWID;
+            CREATE UNIQUE INDEX IF NOT EXISTS result_rows_key ON result_rows(result_id, key);
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                digest INTEGER NOT NULL,
+                fields TEXT NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS user_profiles_user ON user_profiles(user_id, digest);
+            CREATE TABLE IF NOT EXISTS result_sources (
+                result_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                source TEXT NOT NULL,
+                PRIMARY KEY (result_id, key, source)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS result_sources_source ON result_sources(result_id, source);
+            CREATE TABLE IF NOT EXISTS crawl_state (
+                key TEXT PRIMARY KEY,
+                result_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                owner TEXT,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, updated_at);
+            CREATE TABLE IF NOT EXISTS comments (
+                result_id TEXT NOT NULL,
+                comment_id INTEGER NOT NULL,
+                post_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                date INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                UNIQUE (result_id, comment_id)
+            );
+            CREATE INDEX IF NOT EXISTS comments_user ON comments(result_id, user_id, post_id);
+            CREATE TABLE IF NOT EXISTS commenters (
+                result_id TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT COLLATE NOCASE,
+                comments INTEGER NOT NULL,
+                posts INTEGER NOT NULL,
+                first_seen INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL,
+                PRIMARY KEY (result_id, user_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS commenters_username ON commenters(result_id, username);
+        """)
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(result_rows)")]
+        if "profile_id" not in columns:
+            self._conn.execute("ALTER TABLE result_rows ADD COLUMN profile_id INTEGER")
+        # Finds the rows of a user, and those still referring to a profile
+        # when results are deleted
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS result_rows_profile ON result_rows(profile_id) WHERE profile_id IS NOT NULL"
+        )
+        # Rows stored before the registry, found by their key (the user id)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS result_rows_unregistered ON result_rows(key) WHERE profile_id IS NULL"
+        )
+        # Which fields of a result's rows are kept in the user registry
+        self._user_fields: Dict[str, list] = {}
+
+        # Each result's comments have their own text index, so a search reads
+        # only that result's postings; without FTS5 in this SQLite build,
+        # search scans instead
+        try:
+            self._conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(text)")
+            self._conn.execute("DROP TABLE temp.fts5_probe")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False
+        if self.full_text:
+            self._split_text_index()
+
+    def _split_text_index(self):
+        """Replace the text index shared by all results, from older versions,
+        with one index per result."""
+        with self._transaction() as conn:
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'comments_text'").fetchone():
+                return
+            conn.execute("DROP TRIGGER IF EXISTS comments_text_insert")
+            conn.execute("DROP TRIGGER IF EXISTS comments_text_delete")
+            conn.execute("DROP TABLE comments_text")
+            for row in conn.execute("SELECT DISTINCT result_id FROM comments").fetchall():
+                table = self._text_table(conn, row["result_id"], create=True)
+                if table:
+                    conn.execute(
+                        f"INSERT INTO {table} (rowid, text) SELECT rowid, text FROM comments WHERE result_id = ?",
+                        (row["result_id"],)
+                    )
+
+    def _text_table(self, conn, result_id: str, create: bool = False) -> Optional[str]:
+        """The text index of a result's comments, named by the result's rowid
+        since ids are user input; None if the result or its index is missing."""
+        row = conn.execute("SELECT rowid FROM results WHERE id = ?", (result_id,)).fetchone()
+        if not row:
+            return None
+        table = f"comments_text_{row[0]}"
+        if create:
+            # Contentless: the text stays in comments, the index only maps words to rowids
+            conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                "text, content='', tokenize='unicode61 remove_diacritics 2')"
+            )
+        elif not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+            return None
+        return table
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def create(self, kind: str, meta: Optional[dict] = None, result_id: Optional[str] = None) -> str:
+        result_id = result_id or uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO results (id, kind, created_at, updated_at, meta) VALUES (?, ?, ?, ?, ?)",
+                (result_id, kind, now, now, json.dumps(meta or {}))
+            )
+        self.evict()
+        return result_id
+
+    def get(self, result_id: str) -> Optional[StoredResult]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM results WHERE id = ?", (result_id,)).fetchone()
+        if not row:
+            return None
+        return StoredResult(
+            id=row["id"],
+            kind=row["kind"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            total_count=row["total_count"],
+            meta=json.loads(row["meta"])
+        )
+
+    def update_meta(self, result_id: str, **fields):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT meta FROM results WHERE id = ?", (result_id,)).fetchone()
+            if not row:
+                return
+            meta = json.loads(row["meta"])
+            meta.update(fields)
+            conn.execute(
+                "UPDATE results SET meta = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(meta), time.time(), result_id)
+            )
+
+    def append(self, result_id: str, rows: Iterable, key=None, user_fields: Optional[Sequence] = None) -> int:
+        """Append rows in one transaction and return how many were new.
+
+        With `user_fields` (for each of `PROFILE_FIELDS`, the field name or
+        index of array rows holding it, or None if rows don't have it),
+        the profile is moved to the user registry under the user id in
+        `key`, and put back when the rows are read.
+        """
+        return self.merge(result_id, rows, key, (), None, user_fields)
+
+    def merge(self, result_id: str, rows: Iterable, key, rank: Sequence, since: Optional[int],
+              user_fields: Optional[Sequence] = None) -> int:
+        """Append rows like `append`, except that a row whose key is taken
+        replaces the stored one when it ranks higher on the `rank` fields
+        (which can't be `user_fields`) and the stored row is numbered
+        `since` or later. Returns how many rows were new.
+
+        Lets concurrent tasks pick the same row per key whatever order
+        they finish in, without replacing rows of an earlier crawl.
+        """
+        added = 0
+        outranks = (
+            "result_id = ? AND key = ? AND seq >= ? AND "
+            f"({', '.join('json_extract(data, ?)' for _ in rank)}) < ({', '.join('?' for _ in rank)})"
+        )
+        with self._transaction() as conn:
+            row = conn.execute("SELECT total_count, meta FROM results WHERE id = ?", (result_id,)).fetchone()
+            if not row:
+                raise KeyError(result_id)
+            seq = row["total_count"]
+            if user_fields is not None:
+                user_fields = list(user_fields)
+                meta = json.loads(row["meta"])
+                if meta.get("user_fields") != user_fields:
+                    meta["user_fields"] = user_fields
+                    conn.execute("UPDATE results SET meta = ? WHERE id = ?", (json.dumps(meta), result_id))
+                self._user_fields[result_id] = user_fields
+            paths = [self._data_path(result_id, field) for field in rank]
+            for data in rows:
+                row_key = str(data[key]) if key is not None else None
+                values = [data[field] for field in rank]
+                profile_id = None
+                if user_fields is not None:
+                    profile_id = self._profile_id(
+                        conn, data[key], [None if field is None else data[field] for field in user_fields]
+                    )
+                    if isinstance(data, dict):
+                        data = {field: value for field, value in data.items() if field not in user_fields}
+                    else:
+                        data = [value for i, value in enumerate(data) if i not in user_fields]
+                data = json.dumps(data, default=str)
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO result_rows (result_id, seq, key, data, profile_id) VALUES (?, ?, ?, ?, ?)",
+                    (result_id, seq, row_key, data, profile_id)
+                )
+                if cursor.rowcount:
+                    seq += 1
+                    added += 1
+                elif rank and row_key is not None and since is not None:
+                    conn.execute(
+                        f"UPDATE result_rows SET data = ?, profile_id = ? WHERE {outranks}",
+                        (data, profile_id, result_id, row_key, since, *paths, *values)
+                    )
+            conn.execute(
+                "UPDATE results SET total_count = ?, updated_at = ? WHERE id = ?",
+                (seq, time.time(), result_id)
+            )
+        return added
+
+    @staticmethod
+    def _profile_id(conn, user_id, values: list) -> int:
+        premium = PROFILE_FIELDS.index("premium")
+        values[premium] = bool(values[premium])
+        fields = json.dumps(values, default=str)
+        # Profiles are looked up by a 64-bit digest, so the index doesn't hold a second copy of them
+        digest = int.from_bytes(hashlib.blake2b(fields.encode(), digest_size=8).digest(), "big", signed=True)
+        row = conn.execute(
+            "SELECT id FROM user_profiles WHERE user_id = ? AND digest = ?", (int(user_id), digest)
+        ).fetchone()
+        if row:
+            return row["id"]
+        return conn.execute(
+            "INSERT INTO user_profiles (user_id, digest, fields) VALUES (?, ?, ?)", (int(user_id), digest, fields)
+        ).lastrowid
+
+    def _load_row(self, result_id: str, row):
+        data = json.loads(row["data"])
+        if row["fields"] is None:
+            return data
+        pairs = [
+            (field, value) for field, value in zip(self._result_user_fields(result_id), json.loads(row["fields"]))
+            if field is not None
+        ]
+        if isinstance(data, dict):
+            data.update(pairs)
+        else:
+            for i, value in sorted(pairs):
+                data.insert(i, value)
+        return data
+
+    def _result_user_fields(self, result_id: str) -> List:
+        user_fields = self._user_fields.get(result_id)
+        if user_fields is None:
+            meta = self._conn.execute("SELECT meta FROM results WHERE id = ?", (result_id,)).fetchone()
+            user_fields = self._user_fields[result_id] = json.loads(meta["meta"]).get("user_fields", [])
+        return user_fields
+
+    def _data_path(self, result_id: str, field) -> str:
+        """The JSON path of `field` in the stored rows of a result, without their profile."""
+        if isinstance(field, str):
+            return f'$."{field}"'
+        moved = [i for i in self._result_user_fields(result_id) if i is not None]
+        return f"$[{field - sum(1 for i in moved if i < field)}]"
+
+    def page(self, result_id: str, offset: int, limit: int) -> List:
+        return [data for _, data in self.rows_after(result_id, offset - 1, limit)]
+
+    def rows_after(self, result_id: str, after: Optional[int], limit: int) -> List[Tuple[int, Any]]:
+        """Up to `limit` rows following the row numbered `after`, with their numbers.
+
+        The row number works as a keyset cursor: a page costs the same
+        anywhere in the result, and rows appended meanwhile don't shift it.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.seq, r.data, p.fields FROM result_rows r LEFT JOIN user_profiles p ON p.id = r.profile_id "
+                "WHERE r.result_id = ? AND r.seq > ? ORDER BY r.seq LIMIT ?",
+                (result_id, -1 if after is None else after, limit)
+            ).fetchall()
+            return [(row["seq"], self._load_row(result_id, row)) for row in rows]
+
+    def iter_chunks(self, result_id: str, chunk_size: int) -> Iterator[List]:
+        offset = 0
+        while True:
+            chunk = self.page(result_id, offset, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+            offset += len(chunk)
+
+    def keys(self, result_id: str, after: Optional[int] = None) -> List[str]:
+        """Keys of the rows already in a result (numbered after `after`), so a resumed crawl can skip them."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM result_rows WHERE result_id = ? AND seq > ? AND key IS NOT NULL",
+                (result_id, -1 if after is None else after)
+            ).fetchall()
+        return [row["key"] for row in rows]
+
+    def rows_by_key(self, result_id: str, keys: List[str]) -> Dict[str, Any]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = [str(key) for key in keys[start:start + 500]]
+                rows = self._conn.execute(
+                    # Without the hint SQLite scans the whole result for each chunk
+                    "SELECT r.key, r.data, p.fields FROM result_rows r INDEXED BY result_rows_key "
+                    "LEFT JOIN user_profiles p ON p.id = r.profile_id "
+                    f"WHERE r.result_id = ? AND r.key IN ({','.join('?' * len(chunk))})",
+                    (result_id, *chunk)
+                ).fetchall()
+                for row in rows:
+                    found[row["key"]] = self._load_row(result_id, row)
+        return found
+
+    def diff_keys(self, old_id: str, new_id: str, fields: Sequence) -> Tuple[List[str], List[str], Dict[str, Tuple]]:
+        """Keys only in `new_id`, keys only in `old_id`, and the `fields` that differ for keys in both.
+
+        `fields` are names, or indexes of array rows, as in `append`. Rows
+        are matched on the key index and compared in SQL, so nothing is
+        decoded; keys come back sorted.
+        """
+        with self._lock:
+            left = [row["key"] for row in self._conn.execute(
+                "SELECT o.key FROM result_rows o WHERE o.result_id = ? AND o.key IS NOT NULL AND NOT EXISTS "
+                "(SELECT 1 FROM result_rows n INDEXED BY result_rows_key WHERE n.result_id = ? AND n.key = o.key) "
+                "ORDER BY CAST(o.key AS INTEGER), o.key",
+                (old_id, new_id)
+            )]
+            old_paths = [self._field_path(old_id, "o", field) for field in fields]
+            new_paths = [self._field_path(new_id, "n", field) for field in fields]
+            differs = [
+                f"json_extract({old_column}, ?) IS NOT json_extract({new_column}, ?)"
+                for (old_column, _), (new_column, _) in zip(old_paths, new_paths)
+            ]
+            paths = [path for pair in zip(old_paths, new_paths) for _, path in pair]
+            cursor = self._conn.cursor()
+            cursor.row_factory = None
+            # One pass over the new rows finds both the joined keys and the changed ones
+            rows = cursor.execute(
+                f"SELECT n.key, o.key IS NULL, {', '.join(differs)} "
+                "FROM result_rows n LEFT JOIN result_rows o INDEXED BY result_rows_key ON o.result_id = ? AND o.key = n.key "
+                "LEFT JOIN user_profiles op ON op.id = o.profile_id LEFT JOIN user_profiles np ON np.id = n.profile_id "
+                "WHERE n.result_id = ? AND n.key IS NOT NULL AND (o.key IS NULL OR "
+                f"(o.profile_id IS NOT n.profile_id OR o.data IS NOT n.data) AND ({' OR '.join(differs)})) "
+                # User ids sort as numbers
+                "ORDER BY CAST(n.key AS INTEGER), n.key",
+                (*paths, old_id, new_id, *paths)
+            ).fetchall()
+        joined = [row[0] for row in rows if row[1]]
+        # Keys that changed the same fields share one tuple of them
+        patterns = {}
+        changed = {}
+        for row in rows:
+            if not row[1]:
+                flags = row[2:]
+                if flags not in patterns:
+                    patterns[flags] = tuple(field for field, differ in zip(fields, flags) if differ)
+                changed[row[0]] = patterns[flags]
+        return joined, left, changed
+
+    def _field_path(self, result_id: str, alias: str, field) -> Tuple[str, str]:
+        """The column of `alias` (a result_rows row) holding `field`, and its JSON path there."""
+        user_fields = self._result_user_fields(result_id)
+        if field in user_fields:
+            return f"{alias}p.fields", f"$[{user_fields.index(field)}]"
+        return f"{alias}.data", self._data_path(result_id, field)
+
+    def find_results(self, kind: str, chat_id: int) -> List[StoredResult]:
+        """Results of `kind` tagged with the chat `chat_id`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM results WHERE kind = ? AND json_extract(meta, '$.chat.id') = ? ORDER BY created_at",
+                (kind, chat_id)
+            ).fetchall()
+        return [
+            StoredResult(
+                id=row["id"], kind=row["kind"], created_at=row["created_at"], updated_at=row["updated_at"],
+                total_count=row["total_count"], meta=json.loads(row["meta"])
+            )
+            for row in rows
+        ]
+
+    def user_results(self, user_id: int) -> List[dict]:
+        """The results a user was found in, newest first, with their row in each.
+
+        The user's profiles lead to their rows through the profile index, so
+        this doesn't depend on how many results are stored.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.result_id, r.seq, r.data, p.fields, res.kind, res.created_at, res.meta "
+                "FROM user_profiles p JOIN result_rows r ON r.profile_id = p.id JOIN results res ON res.id = r.result_id "
+                "WHERE p.user_id = ? "
+                "UNION ALL "
+                "SELECT r.result_id, r.seq, r.data, NULL, res.kind, res.created_at, res.meta "
+                "FROM result_rows r JOIN results res ON res.id = r.result_id "
+                "WHERE r.key = ? AND r.profile_id IS NULL "
+                "ORDER BY created_at DESC",
+                (user_id, str(user_id))
+            ).fetchall()
+            return [
+                {
+                    "result_id": row["result_id"],
+                    "kind": row["kind"],
+                    "created_at": row["created_at"],
+                    "meta": json.loads(row["meta"]),
+                    "seq": row["seq"],
+                    "row": self._load_row(row["result_id"], row)
+                }
+                for row in rows
+            ]
+
+    def add_sources(self, result_id: str, source: str, keys: Iterable[str]):
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO result_sources (result_id, key, source) VALUES (?, ?, ?)",
+                [(result_id, str(key), source) for key in keys]
+            )
+
+    def sources_of(self, result_id: str, keys: List[str]) -> Dict[str, List[str]]:
+        """The sources each of `keys` was found in."""
+        found: Dict[str, List[str]] = {}
+        keys = [str(key) for key in keys]
+        with self._lock:
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, source FROM result_sources WHERE result_id = ? AND key IN ({','.join('?' * len(chunk))})",
+                    (result_id, *chunk)
+                ).fetchall()
+                for row in rows:
+                    found.setdefault(row["key"], []).append(row["source"])
+        return found
+
+    def source_keys(self, result_id: str, source: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM result_sources WHERE result_id = ? AND source = ?", (result_id, source)
+            ).fetchall()
+        return [row["key"] for row in rows]
+
+    def source_counts(self, result_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, COUNT(*) AS count FROM result_sources WHERE result_id = ? GROUP BY source", (result_id,)
+            ).fetchall()
+        return {row["source"]: row["count"] for row in rows}
+
+    def add_comments(self, result_id: str, comments: Iterable[dict]) -> int:
+        """Keep comments (`comment_id`, `post_id`, `user_id`, `username`, `date`
+        as a timestamp, `text`) and update their authors' aggregates; returns
+        how many were new."""
+        added = 0
+        with self._transaction() as conn:
+            table = self._text_table(conn, result_id, create=True) if self.full_text else None
+            for comment in comments:
+                new_post = conn.execute(
+                    "SELECT 1 FROM comments WHERE result_id = ? AND user_id = ? AND post_id = ? LIMIT 1",
+                    (result_id, comment["user_id"], comment["post_id"])
+                ).fetchone() is None
+                date = int(comment["date"])
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO comments (result_id, comment_id, post_id, user_id, date, text) VALUES (?, ?, ?, ?, ?, ?)",
+                    (result_id, comment["comment_id"], comment["post_id"], comment["user_id"], date, comment["text"] or "")
+                )
+                if not cursor.rowcount:
+                    continue
+                added += 1
+                if table:
+                    conn.execute(
+                        f"INSERT INTO {table} (rowid, text) VALUES (?, ?)", (cursor.lastrowid, comment["text"] or "")
+                    )
+                conn.execute(
+                    """INSERT INTO commenters (result_id, user_id, username, comments, posts, first_seen, last_seen)
+                       VALUES (?, ?, ?, 1, 1, ?, ?)
+                       ON CONFLICT (result_id, user_id) DO UPDATE SET
+                           username = coalesce(excluded.username, username),
+                           comments = comments + 1,
+                           posts = posts + ?,
+                           first_seen = min(first_seen, excluded.first_seen),
+                           last_seen = max(last_seen, excluded.last_seen)""",
+                    (result_id, comment["user_id"], comment.get("username"), date, date, int(new_post))
+                )
+        return added
+
+    def search_comments(self, result_id: str, text: Optional[str] = None, user_id: Optional[int] = None,
+                        before: Optional[int] = None, limit: int = 50) -> List[dict]:
+        """Kept comments matching every word of `text` and/or written by
+        `user_id`, last stored first, with their `seq`; `before` is the last
+        `seq` of the previous page.
+
+        Following the index order lets a search stop at `limit` matches
+        instead of sorting all of them.
+        """
+        # A trailing * searches by prefix; words of only quotes and * are dropped
+        words = [
+            (word.replace('"', "").strip("*"), word.endswith("*"))
+            for word in (text or "").split()
+        ]
+        words = [(word, prefix) for word, prefix in words if word]
+        # The lock also keeps the result's text index from being dropped meanwhile
+        with self._lock:
+            table = self._text_table(self._conn, result_id) if words and self.full_text else None
+            if words and self.full_text and not table:
+                # No comment of the result was ever kept
+                return []
+            if table:
+                # Each word is quoted so user input can't be read as FTS syntax
+                match = " ".join(f'"{word}"' + ("*" if prefix else "") for word, prefix in words)
+                # Pages follow the text index, so it can seek to `before`
+                seq = "t.rowid"
+                sql = f"SELECT t.rowid AS seq, c.* FROM {table} t JOIN comments c ON c.rowid = t.rowid WHERE t.text MATCH ?"
+                args = [match]
+            else:
+                seq = "c.rowid"
+                sql = "SELECT c.rowid AS seq, c.* FROM comments c WHERE c.result_id = ?"
+                args = [result_id]
+                for word, _ in words:
+                    sql += " AND c.text LIKE ? ESCAPE '\\'"
+                    escaped = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                    args.append(f"%{escaped}%")
+            if user_id is not None:
+                sql += " AND c.user_id = ?"
+                args.append(user_id)
+            if before is not None:
+                sql += f" AND {seq} < ?"
+                args.append(before)
+            sql += f" ORDER BY {seq} DESC LIMIT ?"
+            args.append(limit)
+            rows = self._conn.execute(sql, args).fetchall()
+        return [
+            {key: row[key] for key in ("seq", "comment_id", "post_id", "user_id", "date", "text")}
+            for row in rows
+        ]
+
+    def commenters(self, result_id: str, user_ids: List) -> Dict[str, dict]:
+        """Aggregates of the kept comments of each of `user_ids`."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(user_ids), 500):
+                chunk = [int(user_id) for user_id in user_ids[start:start + 500]]
+                rows = self._conn.execute(
+                    f"SELECT * FROM commenters WHERE result_id = ? AND user_id IN ({','.join('?' * len(chunk))})",
+                    (result_id, *chunk)
+                ).fetchall()
+                for row in rows:
+                    found[str(row["user_id"])] = {key: row[key] for key in row.keys() if key != "result_id"}
+        return found
+
+    def find_commenter(self, result_id: str, username: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM commenters WHERE result_id = ? AND username = ?",
+                (result_id, username.lstrip("@"))
+            ).fetchone()
+        return {key: row[key] for key in row.keys() if key != "result_id"} if row else None
+
+    def get_crawl_state(self, key: str) -> Optional[dict]:
+        """High-water marks of the last crawl of `key`, with the result they were merged into."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result_id, state, updated_at FROM crawl_state WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"result_id": row["result_id"], "updated_at": row["updated_at"], **json.loads(row["state"])}
+
+    def save_crawl_state(self, key: str, result_id: str, state: dict):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO crawl_state (key, result_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                (key, result_id, json.dumps(state), time.time())
+            )
+
+    def save_job(self, job_id: str, kind: str, status: str, owner: str, data: dict):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, status, owner, data, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, status, owner, json.dumps(data, default=str), time.time())
+            )
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def touch_jobs(self, owner: str):
+        """Mark the unfinished jobs of `owner` as still being worked on."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE owner = ? AND status IN ('queued', 'running', 'suspended')",
+                (time.time(), owner)
+            )
+
+    def release_jobs(self, owner: str):
+        """Let any process claim the unfinished jobs of `owner` right away, e.g. on shutdown."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET owner = NULL, updated_at = 0 WHERE owner = ? AND status IN ('queued', 'running', 'suspended')",
+                (owner,)
+            )
+
+    def claim_jobs(self, owner: str, stale_after: float, job_id: Optional[str] = None) -> List[dict]:
+        """Take over unfinished jobs whose owner stopped refreshing them.
+
+        With `job_id`, only that job is claimed, and also when it failed.
+        Returns the claimed jobs.
+        """
+        cutoff = time.time() - stale_after
+        if job_id:
+            query = ("SELECT id, data FROM jobs WHERE id = ? AND (status = 'failed' OR "
+                     "(status IN ('queued', 'running', 'suspended') AND (updated_at < ? OR owner = ?)))")
+            args = (job_id, cutoff, owner)
+        else:
+            query = ("SELECT id, data FROM jobs WHERE status IN ('queued', 'running', 'suspended') "
+                     "AND updated_at < ? AND (owner IS NULL OR owner != ?)")
+            args = (cutoff, owner)
+        with self._transaction() as conn:
+            rows = conn.execute(query, args).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET owner = ?, updated_at = ? WHERE id = ?",
+                [(owner, time.time(), row["id"]) for row in rows]
+            )
+        return [json.loads(row["data"]) for row in rows]
+
+    def delete(self, result_id: str):
+        with self._transaction() as conn:
+            table = self._text_table(conn, result_id) if self.full_text else None
+            if table:
+                conn.execute(f"DROP TABLE {table}")
+            profile_ids = [row["profile_id"] for row in conn.execute(
+                "SELECT DISTINCT profile_id FROM result_rows WHERE result_id = ? AND profile_id IS NOT NULL", (result_id,)
+            )]
+            conn.execute("DELETE FROM jobs WHERE id = ?", (result_id,))
+            conn.execute("DELETE FROM result_sources WHERE result_id = ?", (result_id,))
+            conn.execute("DELETE FROM commenters WHERE result_id = ?", (result_id,))
+            conn.execute("DELETE FROM comments WHERE result_id = ?", (result_id,))
+            conn.execute("DELETE FROM crawl_state WHERE result_id = ?", (result_id,))
+            conn.execute("DELETE FROM result_rows WHERE result_id = ?", (result_id,))
+            conn.execute("DELETE FROM results WHERE id = ?", (result_id,))
+            # Profiles of the result that no other result refers to
+            conn.executemany(
+                "DELETE FROM user_profiles WHERE id = ? AND NOT EXISTS "
+                "(SELECT 1 FROM result_rows WHERE profile_id = user_profiles.id)",
+                [(profile_id,) for profile_id in profile_ids]
+            )
+        self._user_fields.pop(result_id, None)
+
+    def evict(self):
+        expired = []
+        with self._lock:
+            if self.ttl:
+                expired += [row["id"] for row in self._conn.execute(
+                    "SELECT id FROM results WHERE updated_at < ?", (time.time() - self.ttl,)
+                )]
+            if self.max_rows:
+                total = 0
+                # Kept comments count as rows of their result
+                for row in self._conn.execute(
+                    "SELECT id, total_count + (SELECT count(*) FROM comments c WHERE c.result_id = results.id) AS total_count "
+                    "FROM results ORDER BY updated_at DESC"
+                ):
+                    total += row["total_count"]
+                    if total > self.max_rows and row["id"] not in expired:
+                        expired.append(row["id"])
+        for result_id in expired:
+            self.delete(result_id)
+        return len(expired)
+
+
+class _Transaction:
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+
+
+def open_store(path: str, ttl_hours: Optional[float] = None, max_rows: Optional[int] = None) -> ResultStore:
+    """Open the result store configured by `path` (a SQLite file, or ':memory:')."""
+    return SQLiteResultStore(
+        path,
+        ttl=ttl_hours * 3600 if ttl_hours else None,
+        max_rows=max_rows
+    )